@@ -0,0 +1,123 @@
+import pygame
+
+from spatial import SpatialHash
+from utils import calculate_distance
+from const import *
+
+ACTIVE = "active"
+DROWSY = "drowsy"
+ASLEEP = "asleep"
+
+
+class ActivityScheduler:
+    """
+    Simulation level of detail for enemies, so the update cost follows the enemies near the player.
+    Active enemies are updated every tick. Drowsy ones (in view, outside the alert radius and idle) are updated
+    every ACTIVITY_DROWSY_INTERVAL ticks, and sleeping ones (out of view and idle) aren't updated at all.
+    Sleeping enemies don't move, so they're kept in a spatial hash and woken by querying the area around the player.
+    """
+
+    def __init__(self, group, player_sprite, enemy_system=None):
+        self.group = group
+        self.player_sprite = player_sprite
+        self.enemy_system = enemy_system
+        self.tick = 0
+
+        # Activity of the enemies near the player, in the order they woke up.
+        self.nearby_enemies = {}
+        self.sleeping_enemies = SpatialHash()
+
+        # Enemies within this distance of the player are always active.
+        self.active_distance = ENEMY_ALERT_RADIUS + ACTIVITY_ACTIVE_MARGIN
+
+    def __len__(self):
+        return len(self.nearby_enemies) + len(self.sleeping_enemies)
+
+    def add(self, enemy):
+        """Schedule an enemy, it starts active and is put to rest on the next tick if it can."""
+        self.nearby_enemies[enemy] = ACTIVE
+
+    def remove(self, enemy):
+        """Stop scheduling an enemy, does nothing if it isn't scheduled."""
+        self.nearby_enemies.pop(enemy, None)
+        self.sleeping_enemies.remove(enemy)
+
+    def get_wake_rect(self):
+        """Get the area around the player where enemies are awake, i.e. the largest view plus a margin."""
+        wake_rect = pygame.Rect(
+            0,
+            0,
+            SCREEN_WIDTH / MIN_ZOOM_SCALE + ACTIVITY_WAKE_MARGIN * 2,
+            SCREEN_HEIGHT / MIN_ZOOM_SCALE + ACTIVITY_WAKE_MARGIN * 2,
+        )
+        wake_rect.center = self.player_sprite.rect.center
+        return wake_rect
+
+    def can_rest(self, enemy):
+        """Helper function to check if an enemy has nothing going on which needs updating every tick."""
+        return not enemy.pursuing and not enemy.dying and enemy.hit_countdown == 0
+
+    def set_activity(self, enemy, activity):
+        """Helper function to move an enemy between activities, only active enemies are updated by the group and enemy system."""
+        previous_activity = self.nearby_enemies.get(enemy, ASLEEP)
+        if activity == previous_activity:
+            return
+        if activity == ACTIVE:
+            self.group.wake_sprite(enemy)
+            enemy.tick_interval = 1
+            if self.enemy_system is not None:
+                self.enemy_system.add(enemy)
+        elif previous_activity == ACTIVE:
+            self.group.sleep_sprite(enemy)
+            enemy.tick_interval = ACTIVITY_DROWSY_INTERVAL
+            if self.enemy_system is not None:
+                self.enemy_system.remove(enemy)
+
+        if activity == ASLEEP:
+            del self.nearby_enemies[enemy]
+            self.sleeping_enemies.insert(enemy, enemy.rect)
+        else:
+            self.nearby_enemies[enemy] = activity
+
+    def update(self):
+        """Wake the sleeping enemies near the player, then reschedule the nearby ones, called before the group update."""
+        self.tick += 1
+        wake_rect = self.get_wake_rect()
+        for enemy in self.sleeping_enemies.query(wake_rect):
+            self.sleeping_enemies.remove(enemy)
+            self.nearby_enemies[enemy] = DROWSY
+
+        # Sleeping further away than waking up, so idling on the border doesn't flip every tick.
+        sleep_rect = wake_rect.inflate(TILE_SIZE * 2, TILE_SIZE * 2)
+        for index, (enemy, activity) in enumerate(list(self.nearby_enemies.items())):
+            if not enemy.alive():
+                self.nearby_enemies.pop(enemy, None)
+                continue
+            if not self.can_rest(enemy):
+                activity = ACTIVE
+            elif not sleep_rect.colliderect(enemy.rect):
+                activity = ASLEEP
+            elif (
+                calculate_distance(self.player_sprite.rect.center, enemy.rect.center)
+                <= self.active_distance
+            ):
+                activity = ACTIVE
+            else:
+                activity = DROWSY
+            self.set_activity(enemy, activity)
+
+            # Drowsy enemies are spread over the ticks of an interval.
+            if (
+                activity == DROWSY
+                and (self.tick + index) % ACTIVITY_DROWSY_INTERVAL == 0
+            ):
+                enemy.update()
+
+    def get_stats(self):
+        """Get the number of active, drowsy and sleeping enemies."""
+        activities = list(self.nearby_enemies.values())
+        return {
+            ACTIVE: activities.count(ACTIVE),
+            DROWSY: activities.count(DROWSY),
+            ASLEEP: len(self.sleeping_enemies),
+        }
@@ -0,0 +1,197 @@
+from os import path, listdir
+
+import pygame
+
+from atlas import TextureAtlas
+from utils import (
+    split_spritesheets,
+    create_masks,
+    create_alpha_variants,
+    create_tint_variants,
+)
+from const import *
+
+
+class AssetRegistry:
+    """
+    Process-wide cache of decoded spritesheets, keyed by (sheet, frame size, scale, flip).
+    Each sheet is read from disk and split once, the frame lists are then shared by every sprite using them.
+    A collision mask is built alongside every frame so entities never have to build one per frame.
+    Effect variants of the frames (e.g. "transparent" and "hit") are built once on first use, so effects
+    swap frames instead of mutating the shared surfaces.
+    With USE_TEXTURE_ATLAS, frames, variants and shadows are packed into the pages of a texture atlas as they're decoded.
+    """
+
+    def __init__(self):
+        self.atlas = TextureAtlas() if USE_TEXTURE_ATLAS else None
+        self.spritesheets = {}
+        self.masks = {}
+        self.variants = {}
+        self.shadows = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_key(
+        self,
+        spritesheet_dir,
+        spritesheet_name,
+        width,
+        height,
+        scale_factor=1.0,
+        flipped=False,
+    ):
+        """Helper function to get the cache key of a spritesheet, decoding it on a miss."""
+        key = (
+            path.join(spritesheet_dir, spritesheet_name),
+            width,
+            height,
+            scale_factor,
+            flipped,
+        )
+        if key not in self.spritesheets:
+            self.misses += 1
+            spritesheets = self.pack(
+                split_spritesheets(
+                    spritesheet_dir,
+                    spritesheet_name,
+                    width,
+                    height,
+                    scale_factor,
+                    flipped,
+                )
+            )
+            self.spritesheets[key] = spritesheets
+            self.masks[key] = create_masks(spritesheets)
+        else:
+            self.hits += 1
+        return key
+
+    def get_variants(self, variant, key):
+        """Helper function to get the effect variant of a cached spritesheet, building it on first use."""
+        variants = self.variants.get((variant, key))
+        if variants is None:
+            variants = self.pack(self.create_variants(variant, self.spritesheets[key]))
+            self.variants[(variant, key)] = variants
+        return variants
+
+    def pack(self, spritesheets):
+        """Helper function to pack the frames of spritesheets into the atlas, if there's one."""
+        if self.atlas is None:
+            return spritesheets
+        return self.atlas.add_spritesheets(spritesheets)
+
+    def create_variants(self, variant, spritesheets):
+        """Helper function to build the frames of an effect variant."""
+        match variant:
+            case "transparent":
+                return create_alpha_variants(spritesheets, ALPHA_TRANSPARENT)
+            case "hit":
+                return create_tint_variants(spritesheets, HIT_TINT_COLOR)
+            case _:
+                raise NotImplementedError(variant)
+
+    def load_dir_assets(
+        self, variant, spritesheets_dir, width, height, scale_factor=1.0, flipped=False
+    ):
+        """
+        Get the spritesheets, masks and an effect variant of every spritesheet in a directory, as three dicts.
+        Each spritesheet is looked up once for all three, so the stats count a hit or miss per spritesheet.
+        """
+        spritesheets = {}
+        masks = {}
+        variants = {}
+        for key in self.get_dir_keys(
+            spritesheets_dir, width, height, scale_factor, flipped
+        ):
+            spritesheets.update(self.spritesheets[key])
+            masks.update(self.masks[key])
+            variants.update(self.get_variants(variant, key))
+        return spritesheets, masks, variants
+
+    def get_dir_keys(
+        self, spritesheets_dir, width, height, scale_factor=1.0, flipped=False
+    ):
+        """Helper function to get the cache keys of every spritesheet in a directory."""
+        return [
+            self.get_key(spritesheets_dir, image, width, height, scale_factor, flipped)
+            for image in sorted(listdir(spritesheets_dir))
+            if path.isfile(path.join(spritesheets_dir, image))
+        ]
+
+    def get_enemy_key(self, enemy_name):
+        """Helper function to get the cache key of an enemy spritesheet."""
+        return self.get_key(
+            path.join("assets", "enemies"),
+            f"{enemy_name}.png",
+            ENEMY_SPRITE_WIDTH,
+            ENEMY_SPRITE_HEIGHT,
+            flipped=True,
+        )
+
+    def get_enemy_assets(self, variant, enemy_name):
+        """Get the left and right facing spritesheets of an enemy, their masks and an effect variant of them."""
+        key = self.get_enemy_key(enemy_name)
+        return self.spritesheets[key], self.masks[key], self.get_variants(variant, key)
+
+    def preload_enemies(self, enemy_names):
+        """Decode the spritesheets of every enemy name ahead of time."""
+        for enemy_name in enemy_names:
+            self.get_enemy_key(enemy_name)
+
+    def evict(self, keys):
+        """Drop cached spritesheets with their masks and variants, their atlas areas are reused by the next frames packed."""
+        for key in keys:
+            spritesheets = self.spritesheets.pop(key, None)
+            if spritesheets is None:
+                continue
+            self.evictions += 1
+            del self.masks[key]
+            evicted = [spritesheets]
+            for variant_key in [
+                variant_key for variant_key in self.variants if variant_key[1] == key
+            ]:
+                evicted.append(self.variants.pop(variant_key))
+            if self.atlas is not None:
+                for evicted_spritesheets in evicted:
+                    for sprites in evicted_spritesheets.values():
+                        self.atlas.remove(sprites)
+
+    def evict_enemies(self, enemy_names):
+        """Drop the spritesheets of every enemy but the ones in enemy_names, e.g. the enemies of the previous level."""
+        enemies_dir = path.join("assets", "enemies")
+        kept_paths = {path.join(enemies_dir, f"{name}.png") for name in enemy_names}
+        self.evict(
+            [
+                key
+                for key in self.spritesheets
+                if path.dirname(key[0]) == enemies_dir and key[0] not in kept_paths
+            ]
+        )
+
+    def get_stats(self):
+        """Get the cache hit/miss/eviction stats, and the atlas stats if there's one."""
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "cached": len(self.spritesheets),
+        }
+        if self.atlas is not None:
+            stats["atlas"] = self.atlas.get_stats()
+        return stats
+
+    def get_shadow(self, size, rgba):
+        """Get the shared ellipse shadow image of a size and color."""
+        key = (size, rgba)
+        shadow = self.shadows.get(key)
+        if shadow is None:
+            shadow = pygame.Surface(size, pygame.SRCALPHA)
+            pygame.draw.ellipse(shadow, rgba, shadow.get_rect())
+            if self.atlas is not None:
+                shadow = self.atlas.add(shadow)
+            self.shadows[key] = shadow
+        return shadow
+
+
+registry = AssetRegistry()
@@ -0,0 +1,114 @@
+import pygame
+
+from const import *
+
+
+class TextureAtlas:
+    """
+    Packs sprite frames into a few large ATLAS_PAGE_SIZE pages in the display format, shelf by shelf.
+    Packed frames are subsurfaces of their page, so they still work everywhere a Surface does (rects, masks, copies),
+    while their pixels live side by side in a single allocation per page. regions maps every packed frame to its
+    (page, source rect), which CameraGroup blits from directly. Frames larger than a page are kept as they are.
+    The areas of removed frames are reused by the next frames of the same size.
+    """
+
+    def __init__(self, page_size=ATLAS_PAGE_SIZE, padding=ATLAS_PADDING):
+        self.page_size = page_size
+        self.padding = padding
+        self.pages = []
+
+        # Shelves of every page as [top, height, next free x], and the next free y of every page.
+        self.shelves = []
+        self.page_tops = []
+        self.regions = {}
+
+        # Areas of removed frames by size, as (page, source rect).
+        self.free_areas = {}
+
+    def __len__(self):
+        return len(self.regions)
+
+    def add_page(self):
+        """Helper function to add an empty page, returns its index."""
+        page = pygame.Surface((self.page_size, self.page_size), pygame.SRCALPHA)
+        self.pages.append(page.convert_alpha())
+        self.shelves.append([])
+        self.page_tops.append(0)
+        return len(self.pages) - 1
+
+    def allocate(self, width, height):
+        """
+        Helper function to find room for a width x height frame, returns (page index, x, y).
+        The frame goes on the shortest shelf it fits on, otherwise a new shelf is opened below the others, then a new page.
+        """
+        padded_width = width + self.padding
+        padded_height = height + self.padding
+        best = None
+        for page_index, shelves in enumerate(self.shelves):
+            for shelf in shelves:
+                top, shelf_height, next_x = shelf
+                if (
+                    shelf_height >= padded_height
+                    and next_x + padded_width <= self.page_size
+                    and (best is None or shelf_height < best[1][1])
+                ):
+                    best = (page_index, shelf)
+        if best is not None:
+            page_index, shelf = best
+            x = shelf[2]
+            shelf[2] += padded_width
+            return page_index, x, shelf[0]
+
+        for page_index in range(len(self.pages)):
+            if self.page_tops[page_index] + padded_height <= self.page_size:
+                break
+        else:
+            page_index = self.add_page()
+        top = self.page_tops[page_index]
+        self.shelves[page_index].append([top, padded_height, padded_width])
+        self.page_tops[page_index] += padded_height
+        return page_index, 0, top
+
+    def add(self, surface):
+        """Copy a frame into the atlas, returns the packed frame to use instead of it."""
+        width, height = surface.get_size()
+        if width > self.page_size or height > self.page_size or width * height == 0:
+            return surface
+        free_areas = self.free_areas.get((width, height))
+        if free_areas:
+            page, area = free_areas.pop()
+        else:
+            page_index, x, y = self.allocate(width, height)
+            page = self.pages[page_index]
+            area = pygame.Rect(x, y, width, height)
+        page.blit(surface, area)
+        frame = page.subsurface(area)
+        self.regions[frame] = (page, area)
+        return frame
+
+    def add_spritesheets(self, spritesheets):
+        """Pack every frame of a {name: [frame, ...]} dict, returns the same dict with the packed frames."""
+        return {
+            name: [self.add(sprite) for sprite in sprites]
+            for name, sprites in spritesheets.items()
+        }
+
+    def remove(self, frames):
+        """Free the areas of packed frames, e.g. the ones of evicted spritesheets. Frames which aren't packed are ignored."""
+        for frame in frames:
+            region = self.regions.pop(frame, None)
+            if region is None:
+                continue
+            page, area = region
+            page.fill((0, 0, 0, 0), area)
+            self.free_areas.setdefault(area.size, []).append(region)
+
+    def get_stats(self):
+        """Get the number of pages and packed frames, and how much of the pages the frames fill."""
+        used_area = sum(area.width * area.height for _, area in self.regions.values())
+        total_area = len(self.pages) * self.page_size * self.page_size
+        return {
+            "pages": len(self.pages),
+            "frames": len(self.regions),
+            "fill": used_area / total_area if total_area else 0.0,
+        }
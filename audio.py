@@ -0,0 +1,148 @@
+import re
+import threading
+from os import path, listdir
+
+import pygame
+
+from const import *
+
+# Effect files are named like 07_human_atk_sword_1.wav, the variants of an effect share its name.
+SOUND_FILE_PATTERN = re.compile(
+    r"^\d+_(?P<name>.+?)(?:_(?P<variant>\d+))?(?P<loop>_loop)?$"
+)
+
+
+def get_sound_name(file_name):
+    """Get the effect name of a sound file (e.g. human_atk_sword), None if it isn't an effect file."""
+    stem, extension = path.splitext(file_name)
+    match = SOUND_FILE_PATTERN.match(stem)
+    if extension not in (".wav", ".ogg", ".mp3") or match is None:
+        return None
+    return match["name"] + (match["loop"] or "")
+
+
+class SoundBank:
+    """
+    Sound effects decoded once into pygame.mixer.Sound objects, played through a fixed pool of SOUND_CHANNELS channels.
+    A sound takes a free channel, otherwise it steals the oldest one playing a sound of lower or equal priority, otherwise it's dropped.
+    The same effect played again within SOUND_THROTTLE_MS is dropped too, so a crowd of enemies hit together sounds once.
+    Nothing plays until preload() has decoded an effect, and nothing at all without a mixer (e.g. benchmarks and batch runs).
+    """
+
+    def __init__(self, sfx_dir=path.join("assets", "sfx")):
+        self.sfx_dir = sfx_dir
+        self.sounds = {}
+        self.loaded = threading.Event()
+        self.thread = None
+
+        # Channel pool, with the priority and start time of what each channel is playing.
+        self.channels = []
+        self.channel_priorities = []
+        self.channel_starts = []
+
+        # Round robin variant index and last play time of every effect.
+        self.next_variants = {}
+        self.last_plays = {}
+        self.played = 0
+        self.throttled = 0
+        self.stolen = 0
+        self.dropped = 0
+
+    def preload(self, background=True):
+        """Decode every effect of sfx_dir, on a background thread unless told otherwise. Does nothing without a mixer."""
+        if self.thread is not None or self.loaded.is_set():
+            return
+        if not pygame.mixer.get_init():
+            self.loaded.set()
+            return
+        pygame.mixer.set_num_channels(SOUND_CHANNELS)
+        self.channels = [pygame.mixer.Channel(index) for index in range(SOUND_CHANNELS)]
+        self.channel_priorities = [0] * SOUND_CHANNELS
+        self.channel_starts = [0] * SOUND_CHANNELS
+        if background:
+            self.thread = threading.Thread(target=self.load_sounds, daemon=True)
+            self.thread.start()
+        else:
+            self.load_sounds()
+
+    def load_sounds(self):
+        """Helper function to decode the effects, every effect becomes playable as soon as its variants are decoded."""
+        sound_files = {}
+        for file_name in sorted(listdir(self.sfx_dir)):
+            name = get_sound_name(file_name)
+            if name is not None:
+                sound_files.setdefault(name, []).append(file_name)
+
+        for name, file_names in sound_files.items():
+            variants = []
+            for file_name in file_names:
+                # Formats the mixer wasn't built with are skipped.
+                try:
+                    sound = pygame.mixer.Sound(path.join(self.sfx_dir, file_name))
+                except pygame.error:
+                    continue
+                sound.set_volume(SOUND_VOLUME)
+                variants.append(sound)
+            if variants:
+                self.sounds[name] = variants
+        self.loaded.set()
+
+    def wait(self, timeout=None):
+        """Block until every effect is decoded, returns whether they are."""
+        return self.loaded.wait(timeout)
+
+    def get_channel(self, priority):
+        """Helper function to get a free channel, or the one to steal for a sound of priority, None if there's none."""
+        steal_index = None
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return index
+            if self.channel_priorities[index] <= priority and (
+                steal_index is None
+                or self.channel_starts[index] < self.channel_starts[steal_index]
+            ):
+                steal_index = index
+        if steal_index is not None:
+            self.stolen += 1
+        return steal_index
+
+    def play(self, name):
+        """Play an effect with its SOUND_PRIORITIES priority, returns whether it's playing."""
+        variants = self.sounds.get(name)
+        if variants is None:
+            return False
+
+        now = pygame.time.get_ticks()
+        last_play = self.last_plays.get(name)
+        if last_play is not None and now - last_play < SOUND_THROTTLE_MS:
+            self.throttled += 1
+            return False
+
+        priority = SOUND_PRIORITIES.get(name, 0)
+        index = self.get_channel(priority)
+        if index is None:
+            self.dropped += 1
+            return False
+
+        # Variants are cycled through so repeats don't sound identical.
+        variant = self.next_variants.get(name, 0)
+        self.next_variants[name] = (variant + 1) % len(variants)
+        self.channels[index].play(variants[variant])
+        self.channel_priorities[index] = priority
+        self.channel_starts[index] = now
+        self.last_plays[name] = now
+        self.played += 1
+        return True
+
+    def get_stats(self):
+        """Get the number of loaded effects, and of played, throttled, stolen and dropped sounds."""
+        return {
+            "effects": len(self.sounds),
+            "played": self.played,
+            "throttled": self.throttled,
+            "stolen": self.stolen,
+            "dropped": self.dropped,
+        }
+
+
+sound_bank = SoundBank()
@@ -0,0 +1,315 @@
+"""
+Parallel headless batch runner for balancing and stress tests, e.g.
+python batch.py --enemies 50 100 --seeds 8 --override ENEMY_VEL=1,1.5 --override ENEMY_ALERT_RADIUS=150,200
+
+Every combination of map, enemy count and constant overrides is played once per seed by the hunting AI
+(controls.HuntControls), each in its own process. Jobs end when the player dies or after --frames ticks.
+"""
+
+import os
+
+# Must be set before config is imported, spawned workers inherit it.
+os.environ["DUNGEON_BREAKOUT_HEADLESS"] = "1"
+
+import argparse
+import ast
+import itertools
+import json
+import multiprocessing
+import sys
+import traceback
+from os import path
+from time import perf_counter
+
+import const
+
+
+def parse_override(override):
+    """Parse a NAME=VALUE[,VALUE...] override into the constant name and its list of values."""
+    name, separator, values = override.partition("=")
+    if not separator or not values:
+        raise ValueError(f"Override {override!r} isn't NAME=VALUE[,VALUE...].")
+    if not name.isupper() or not hasattr(const, name):
+        raise ValueError(f"Override {override!r} doesn't name a constant of const.py.")
+    try:
+        values = [ast.literal_eval(value) for value in values.split(",")]
+    except (ValueError, SyntaxError):
+        raise ValueError(
+            f"Override {override!r} has a value which isn't a Python literal."
+        )
+
+    # Values must have the type of the constant, ints and floats are interchangeable.
+    constant_type = type(getattr(const, name))
+    for value in values:
+        if not is_type_compatible(value, constant_type):
+            raise ValueError(
+                f"Override {override!r} has a value of type {type(value).__name__}, "
+                f"{name} is of type {constant_type.__name__}."
+            )
+    return name, values
+
+
+def is_type_compatible(value, constant_type):
+    """Helper function to check whether an override value can replace a constant of constant_type."""
+    numeric_types = (int, float)
+    if constant_type in numeric_types and not isinstance(value, bool):
+        return isinstance(value, numeric_types)
+    return type(value) is constant_type
+
+
+def get_jobs(
+    maps,
+    enemy_counts,
+    overrides,
+    seeds,
+    frames,
+    use_enemy_system,
+    use_activity_scheduler,
+    use_crowd_separation,
+):
+    """Get a job for every combination of map, enemy count, override values and seed."""
+    names = list(overrides.keys())
+    jobs = []
+    for tmx_path, enemies, values in itertools.product(
+        maps, enemy_counts, itertools.product(*overrides.values())
+    ):
+        for seed in range(seeds):
+            jobs.append(
+                {
+                    "index": len(jobs),
+                    "map": tmx_path,
+                    "enemies": enemies,
+                    "overrides": dict(zip(names, values)),
+                    "seed": seed,
+                    "frames": frames,
+                    "enemy_system": use_enemy_system,
+                    "activity_scheduler": use_activity_scheduler,
+                    "crowd_separation": use_crowd_separation,
+                }
+            )
+    return jobs
+
+
+def run_job(job):
+    """Run a job in a fresh worker process, a job which raises gets a result with its traceback in "error" instead."""
+    try:
+        return play_job(job)
+    except Exception:
+        return {**job, "error": traceback.format_exc()}
+
+
+def play_job(job):
+    """
+    Play a single job and get its outcome and per tick cost.
+    Overrides are set on const before the game modules are imported, so their `from const import *` picks them up.
+    Constants computed from an overridden one in const.py (e.g. the knockback distances) keep their original value.
+    """
+    for name, value in job["overrides"].items():
+        setattr(const, name, value)
+
+    from main import Game
+    from controls import HuntControls
+    from benchmark import spawn_random_enemies
+    from profiler import get_percentile
+
+    start = perf_counter()
+    controls = HuntControls()
+    game = Game(
+        controls,
+        job["enemy_system"],
+        False,
+        job["activity_scheduler"],
+        use_crowd_separation=job["crowd_separation"],
+    )
+    controls.attach(game)
+    game.load_map(job["map"])
+    spawn_random_enemies(game, job["enemies"], job["seed"])
+    enemies = [sprite for sprite in game.camera_group if hasattr(sprite, "enemy_name")]
+
+    # Only the simulation is run, it doesn't depend on rendering.
+    player_sprite = game.player_sprite
+    tick_costs = []
+    damage_taken = 0
+    survival_ticks = job["frames"]
+    for tick in range(job["frames"]):
+        health = player_sprite.health
+        tick_start = perf_counter()
+        game.update()
+        tick_costs.append(perf_counter() - tick_start)
+        damage_taken += max(health - player_sprite.health, 0)
+        if player_sprite.dying or not player_sprite.alive():
+            survival_ticks = tick + 1
+            break
+
+    tick_costs.sort()
+    return {
+        **job,
+        "error": None,
+        "survived": survival_ticks == job["frames"],
+        "survival_ticks": survival_ticks,
+        "survival_s": survival_ticks * const.FIXED_TIMESTEP,
+        "damage_taken": damage_taken,
+        "enemies_killed": sum(
+            1 for enemy in enemies if enemy.dying or not enemy.alive()
+        ),
+        "tick_ms": {
+            "mean": sum(tick_costs) * 1000 / len(tick_costs),
+            **{
+                f"p{percentile}": get_percentile(tick_costs, percentile) * 1000
+                for percentile in const.PROFILER_PERCENTILES
+            },
+            "max": tick_costs[-1] * 1000,
+        },
+        "wall_s": perf_counter() - start,
+    }
+
+
+def aggregate(results):
+    """Group the job results by configuration (i.e. everything but the seed) and average them, failed jobs are skipped."""
+    groups = {}
+    for result in results:
+        if result["error"] is not None:
+            continue
+        key = (
+            result["map"],
+            result["enemies"],
+            tuple(result["overrides"].items()),
+            result["enemy_system"],
+            result["activity_scheduler"],
+            result["crowd_separation"],
+        )
+        groups.setdefault(key, []).append(result)
+
+    summaries = []
+    for (
+        tmx_path,
+        enemies,
+        overrides,
+        use_enemy_system,
+        use_activity_scheduler,
+        use_crowd_separation,
+    ), group in groups.items():
+        runs = len(group)
+        summaries.append(
+            {
+                "map": tmx_path,
+                "enemies": enemies,
+                "overrides": dict(overrides),
+                "enemy_system": use_enemy_system,
+                "activity_scheduler": use_activity_scheduler,
+                "crowd_separation": use_crowd_separation,
+                "runs": runs,
+                "survival_rate": sum(result["survived"] for result in group) / runs,
+                "mean_survival_s": sum(result["survival_s"] for result in group) / runs,
+                "mean_damage_taken": sum(result["damage_taken"] for result in group)
+                / runs,
+                "mean_enemies_killed": sum(result["enemies_killed"] for result in group)
+                / runs,
+                "tick_ms": {
+                    name: sum(result["tick_ms"][name] for result in group) / runs
+                    for name in group[0]["tick_ms"]
+                    if name != "max"
+                }
+                | {"max": max(result["tick_ms"]["max"] for result in group)},
+            }
+        )
+    return summaries
+
+
+def run_batch(jobs, workers=None):
+    """Run jobs in a pool of worker processes and get the aggregated report."""
+    workers = workers or os.cpu_count()
+    start = perf_counter()
+
+    # Every job gets a fresh spawned process, since constant overrides only apply before the game modules are imported.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(min(workers, len(jobs)), maxtasksperchild=1) as pool:
+        results = sorted(
+            pool.imap_unordered(run_job, jobs), key=lambda result: result["index"]
+        )
+
+    return {
+        "workers": workers,
+        "jobs": len(jobs),
+        "wall_s": perf_counter() - start,
+        "cpu_s": sum(result.get("wall_s", 0.0) for result in results),
+        "failed": sum(1 for result in results if result["error"] is not None),
+        "summary": aggregate(results),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parallel headless Dungeon Breakout batch runner."
+    )
+    parser.add_argument(
+        "--maps", nargs="+", default=[path.join("maps", "tmx", "open_island.tmx")]
+    )
+    parser.add_argument("--enemies", nargs="+", type=int, default=[50])
+    parser.add_argument(
+        "--seeds", type=int, default=4, help="Number of seeds per configuration."
+    )
+    parser.add_argument(
+        "--frames", type=int, default=const.FPS * 60, help="Maximum ticks per job."
+    )
+    parser.add_argument(
+        "--override",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE[,VALUE...]",
+        help="Override a constant of const.py, every value is tried. Can be repeated.",
+    )
+    parser.add_argument(
+        "--enemy-system",
+        action="store_true",
+        help="Use the batched NumPy enemy backend.",
+    )
+    parser.add_argument(
+        "--no-activity-scheduler",
+        action="store_true",
+        help="Update every enemy every tick, even far away ones.",
+    )
+    parser.add_argument(
+        "--no-crowd-separation",
+        action="store_true",
+        help="Don't steer enemies away from each other.",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes, all cores by default."
+    )
+    parser.add_argument(
+        "--output", help="Write the JSON report to a file instead of stdout."
+    )
+    args = parser.parse_args()
+
+    try:
+        overrides = dict(parse_override(override) for override in args.override)
+    except ValueError as error:
+        parser.error(str(error))
+
+    jobs = get_jobs(
+        args.maps,
+        args.enemies,
+        overrides,
+        args.seeds,
+        args.frames,
+        args.enemy_system,
+        not args.no_activity_scheduler,
+        not args.no_crowd_separation,
+    )
+    report = run_batch(jobs, args.workers)
+    if report["failed"]:
+        print(
+            f"{report['failed']} of {report['jobs']} jobs failed, see their error.",
+            file=sys.stderr,
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
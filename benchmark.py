@@ -0,0 +1,253 @@
+"""
+Deterministic headless benchmark, e.g.
+python benchmark.py --map maps/tmx/open_island.tmx --enemies 200 --frames 1000
+"""
+
+import os
+
+# Must be set before config is imported.
+os.environ["DUNGEON_BREAKOUT_HEADLESS"] = "1"
+
+import argparse
+import json
+import math
+import random
+from os import path, listdir
+from time import perf_counter
+
+from main import Game
+from controls import ScriptedControls, patrol_script
+from profiler import profiler
+from const import *
+
+PHASES = (
+    "events",
+    "update",
+    "collision",
+    "animation",
+    "projectiles",
+    "draw",
+    "scale",
+    "flip",
+)
+
+
+def get_enemy_names():
+    """Get every enemy name which has a spritesheet."""
+    return sorted(
+        image.replace(".png", "")
+        for image in listdir(path.join("assets", "enemies"))
+        if image.endswith(".png")
+    )
+
+
+def spawn_random_enemies(game, count, seed):
+    """Spawn enemies on random walkable tiles, the same seed always gives the same enemies."""
+    rng = random.Random(seed)
+    enemy_names = get_enemy_names()
+    flow_field = game.camera_group.flow_field
+    walkable_tiles = [
+        tile
+        for tile in range(flow_field.width * flow_field.height)
+        if not flow_field.blocked[tile]
+    ]
+    for _ in range(count):
+        tile = rng.choice(walkable_tiles)
+        pos = (
+            (tile % flow_field.width + 0.5) * TILE_SIZE,
+            (tile // flow_field.width + 0.5) * TILE_SIZE,
+        )
+
+        # While streaming, enemies away from the player start dormant.
+        if game.streamer is not None:
+            game.streamer.add_enemy(rng.choice(enemy_names), pos)
+        else:
+            game.spawn_enemy(
+                rng.choice(enemy_names),
+                pos,
+                game.player_sprite,
+                game.camera_group,
+                game.enemy_system,
+            )
+
+
+def emit_projectiles(game, count, rng, distance=TILE_SIZE * 10):
+    """Spawn count enemy projectiles on a circle around the player, aimed at it with a random spread."""
+    center_x, center_y = game.player_sprite.rect.center
+    positions = []
+    velocities = []
+    for _ in range(count):
+        angle = rng.uniform(0, 2 * math.pi)
+        aim = angle + math.pi + rng.uniform(-0.5, 0.5)
+        positions.append(
+            (
+                center_x + math.cos(angle) * distance,
+                center_y + math.sin(angle) * distance,
+            )
+        )
+        velocities.append(
+            (math.cos(aim) * PROJECTILE_SPEED, math.sin(aim) * PROJECTILE_SPEED)
+        )
+    game.projectile_system.spawn(positions, velocities)
+
+
+def run_benchmark(
+    tmx_path,
+    enemies,
+    frames,
+    seed=0,
+    use_enemy_system=False,
+    streaming=False,
+    use_activity_scheduler=True,
+    trace_path=None,
+    projectile_rate=0,
+    use_crowd_separation=True,
+):
+    """
+    Run a fixed number of frames as fast as possible and get the timings of every phase.
+    Percentiles are over the last PROFILER_HISTORY_FRAMES frames, the Chrome trace is written to trace_path when there's one.
+    With a projectile_rate, that many projectiles are fired at the player every frame.
+    Without use_crowd_separation, enemies don't steer away from each other.
+    """
+    game = Game(
+        ScriptedControls(patrol_script),
+        use_enemy_system,
+        streaming,
+        use_activity_scheduler,
+        projectile_rate > 0,
+        use_crowd_separation,
+    )
+    game.load_map(tmx_path)
+    spawn_random_enemies(game, enemies, seed)
+    projectile_rng = random.Random(seed)
+
+    profiler.reset()
+    profiler.enabled = True
+    if trace_path is not None:
+        profiler.start_tracing()
+    start = perf_counter()
+    for _ in range(frames):
+        profiler.next_frame()
+        if projectile_rate > 0:
+            emit_projectiles(game, projectile_rate, projectile_rng)
+        game.handle_events()
+        game.draw()
+        game.update()
+    profiler.next_frame()
+    total = perf_counter() - start
+    profiler.enabled = False
+    if trace_path is not None:
+        profiler.tracing = False
+        profiler.export_trace(trace_path)
+
+    return {
+        "map": tmx_path,
+        "enemies": enemies,
+        "frames": frames,
+        "seed": seed,
+        "enemy_system": use_enemy_system,
+        "streaming": streaming,
+        "activity_scheduler": use_activity_scheduler,
+        "projectile_rate": projectile_rate,
+        "crowd_separation": use_crowd_separation,
+        "total_ms": total * 1000,
+        "fps": frames / total if total > 0 else 0.0,
+        "frame_percentiles_ms": {
+            f"p{percentile}": value
+            for percentile, value in profiler.get_percentiles().items()
+        },
+        "phases": {
+            phase: {
+                "total_ms": profiler.totals.get(phase, 0.0) * 1000,
+                "per_frame_ms": profiler.totals.get(phase, 0.0) * 1000 / frames,
+                **{
+                    f"p{percentile}_ms": value
+                    for percentile, value in profiler.get_percentiles(phase).items()
+                },
+            }
+            for phase in PHASES
+        },
+        "alive_enemies": sum(
+            1 for sprite in game.camera_group if hasattr(sprite, "enemy_name")
+        ),
+        "streamer": game.streamer.get_stats() if game.streamer is not None else None,
+        "projectiles": (
+            {
+                "live": len(game.projectile_system),
+                "dropped": game.projectile_system.dropped,
+            }
+            if game.projectile_system is not None
+            else None
+        ),
+        "activity": (
+            game.activity_scheduler.get_stats()
+            if game.activity_scheduler is not None
+            else None
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Dungeon Breakout benchmark.")
+    parser.add_argument("--map", default=path.join("maps", "tmx", "open_island.tmx"))
+    parser.add_argument("--enemies", type=int, default=100)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--enemy-system",
+        action="store_true",
+        help="Use the batched NumPy enemy backend.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Only keep the chunks around the player loaded.",
+    )
+    parser.add_argument(
+        "--no-activity-scheduler",
+        action="store_true",
+        help="Update every enemy every tick, even far away ones.",
+    )
+    parser.add_argument(
+        "--no-crowd-separation",
+        action="store_true",
+        help="Don't steer enemies away from each other.",
+    )
+    parser.add_argument(
+        "--projectiles",
+        type=int,
+        default=0,
+        metavar="RATE",
+        help="Fire RATE projectiles at the player every frame.",
+    )
+    parser.add_argument(
+        "--output", help="Write the JSON report to a file instead of stdout."
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write a Chrome trace (chrome://tracing, Perfetto) of the run.",
+    )
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.map,
+        args.enemies,
+        args.frames,
+        args.seed,
+        args.enemy_system,
+        args.streaming,
+        not args.no_activity_scheduler,
+        args.trace,
+        args.projectiles,
+        not args.no_crowd_separation,
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
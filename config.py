@@ -1,8 +1,35 @@
+import os
+
 import pygame
 
-from const import SCREEN_WIDTH, SCREEN_HEIGHT, CAPTION
+from const import (
+    SCREEN_WIDTH,
+    SCREEN_HEIGHT,
+    CAPTION,
+    SOUND_FREQUENCY,
+    SOUND_BUFFER_SIZE,
+)
+
+# Headless mode uses SDL's dummy drivers and doesn't cap the frame rate, for benchmarks and machines without a display.
+HEADLESS = os.environ.get("DUNGEON_BREAKOUT_HEADLESS") == "1"
+
+
+def init_display():
+    """
+    Initialize pygame and open the game window, returns the display surface.
+    Importing the game modules doesn't touch the display, this is called by the entry points before anything is drawn
+    or converted (see Game.load_map). Calling it again while the window is open returns the open one.
+    """
+    screen = pygame.display.get_surface()
+    if screen is not None:
+        return screen
+    if HEADLESS:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
 
-pygame.init()
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption(CAPTION)
-clock = pygame.time.Clock()
+    # A small mixer buffer keeps the latency of sound effects low.
+    pygame.mixer.pre_init(SOUND_FREQUENCY, -16, 2, SOUND_BUFFER_SIZE)
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption(CAPTION)
+    return screen
@@ -1,7 +1,65 @@
 # Pygame constants.
 FPS = 60
+FIXED_TIMESTEP = 1 / FPS
+MAX_RENDER_FPS = 144
+MAX_FRAME_TIME = 0.25
+MAX_TICKS_PER_FRAME = 5
+MAX_SKIPPED_FRAMES = 4
 CAPTION = "Dungeon Breakout"
 
+# Map cache constants.
+MAP_CACHE_DIR = "maps/cache"
+MAP_CACHE_EXTENSION = ".dbmap"
+MAP_CACHE_VERSION = 1
+
+# Input recording constants, see recording.py.
+INPUT_RECORDING_VERSION = 2
+
+# Streaming constants, margins are in chunks around the largest view.
+STREAMING_LOAD_MARGIN = 1
+STREAMING_UNLOAD_MARGIN = 2
+STREAMING_IO_WORKERS = 1
+
+# Activity scheduler constants, see activity.ActivityScheduler.
+ACTIVITY_ACTIVE_MARGIN = 48
+ACTIVITY_WAKE_MARGIN = 48
+ACTIVITY_DROWSY_INTERVAL = 4
+
+# Profiler constants, see profiler.Profiler.
+PROFILER_HISTORY_FRAMES = 300
+PROFILER_PERCENTILES = (50, 95, 99)
+PROFILER_MAX_TRACE_EVENTS = 1_000_000
+PROFILER_OVERLAY_KEY = "f3"
+PROFILER_OVERLAY_REFRESH_FRAMES = 15
+PROFILER_OVERLAY_FONT_SIZE = 20
+
+# Crowd constants, see crowd.CrowdGrid.
+CROWD_SEPARATION_RADIUS = 16
+CROWD_SEPARATION_WEIGHT = 1.5
+
+# Projectile constants, see projectiles.ProjectileSystem.
+PROJECTILE_CAPACITY = 8192
+PROJECTILE_RADIUS = 3
+PROJECTILE_SPEED = 2.5
+PROJECTILE_LIFETIME = FPS * 3
+PROJECTILE_DAMAGE = 1
+PROJECTILE_REFLECT_SPEED_SCALE = 1.5
+
+# Level constants, see levels.LevelManager. Levels are played in order and loop, exit triggers lead to the next one.
+LEVELS = ("maps/tmx/open_island.tmx",)
+LEVEL_PRELOAD_BUDGET_MS = 2
+
+# Texture atlas constants, see atlas.TextureAtlas.
+ATLAS_PAGE_SIZE = 1024
+ATLAS_PADDING = 0
+
+# Sound constants, see audio.SoundBank.
+SOUND_FREQUENCY = 44100
+SOUND_BUFFER_SIZE = 512
+SOUND_CHANNELS = 16
+SOUND_VOLUME = 0.5
+SOUND_THROTTLE_MS = 60
+
 # Screen constants.
 DEFAULT_ZOOM_SCALE = 2
 MIN_ZOOM_SCALE = 1
@@ -17,17 +75,41 @@ FLASH_STEP_FRAME = FPS // 10
 HAZARD_TRIGGER = "Hazard"
 OBSTACLE_TRIGGER = "Obstacle"
 PLAYER_SPAWN = "Spawn"
+EXIT_TRIGGER = "Exit"
 
 # Flag constants.
 DEBUG_MODE = False
+USE_ENEMY_SYSTEM = False
+USE_STREAMING = False
+USE_ACTIVITY_SCHEDULER = True
+USE_PROJECTILES = False
+USE_CROWD_SEPARATION = True
+USE_TEXTURE_ATLAS = True
+
+# Sound effect names (see audio.get_sound_name) and their priorities, higher priority sounds steal channels from lower ones.
+PLAYER_ATTACK_SOUND = "sword_miss"
+PLAYER_STEP_SOUND = "human_walk_stone"
+PLAYER_DAMAGE_SOUND = "human_damage"
+PLAYER_DEATH_SOUND = "human_death_spin"
+ENEMY_HIT_SOUND = "sword_hit"
+ENEMY_DAMAGE_SOUND = "orc_damage"
+ENEMY_DEATH_SOUND = "orc_death_spin"
+SOUND_PRIORITIES = {
+    PLAYER_DEATH_SOUND: 5,
+    PLAYER_DAMAGE_SOUND: 4,
+    ENEMY_HIT_SOUND: 3,
+    PLAYER_ATTACK_SOUND: 3,
+    ENEMY_DEATH_SOUND: 2,
+    ENEMY_DAMAGE_SOUND: 2,
+    PLAYER_STEP_SOUND: 1,
+}
 
 # Dimension constants.
 SCREEN_WIDTH, SCREEN_HEIGHT = 1280, 720
-INTERNAL_SCREEN_WIDTH, INTERNAL_SCREEN_HEIGHT = (
-    1280,
-    720,
-)
 TILE_SIZE = 24
+TILES_PER_CHUNK = 16
+SPATIAL_HASH_CELL_SIZE = TILE_SIZE * 4
+MAX_INTERPOLATION_DISTANCE = TILE_SIZE * 2
 PLAYER_SPRITE_WIDTH = 40
 PLAYER_SPRITE_HEIGHT = 40
 PLAYER_SHADOW_WIDTH_SCALE = 2
@@ -49,6 +131,7 @@ ENEMY_CONTACT_DAMANGE = 1
 ENEMY_KNOCKBACK_DISTANCE = ENEMY_SPRITE_WIDTH * 2
 ENEMY_FLASH_FRAMES = FPS
 PLAYER_INVISIBILITY_FRAMES = FPS * 2
+PLAYER_STEP_FRAMES = FPS // 3
 
 # Color constants.
 SHADOW_COLOR = (0, 0, 0, 50)
@@ -57,5 +140,10 @@ HAZARD_TRIGGER_DEBUG_COLOR = "Red"
 OBSTACLE_TRIGGER_DEBUG_COLOR = "Yellow"
 RADIUS_DEBUG_COLOR = "Green"
 RADIUS_LINE_DEBUG_COLOR = "Blue"
+PROFILER_OVERLAY_COLOR = "White"
+PROJECTILE_ENEMY_COLOR = "#ff5a36"
+PROJECTILE_PLAYER_COLOR = "#7df9ff"
+PROFILER_OVERLAY_BACKGROUND_COLOR = (0, 0, 0, 160)
 ALPHA_MAX = 255
 ALPHA_TRANSPARENT = 32
+HIT_TINT_COLOR = (200, 200, 200)
@@ -0,0 +1,160 @@
+import pygame
+
+from utils import calculate_distance
+from const import *
+
+# Fields of an InputState, in the order of their bits when packed.
+INPUT_FIELDS = ("up", "down", "left", "right", "zoom_in", "zoom_out", "attack")
+
+
+class InputState:
+    """Snapshot of the player input for a single tick."""
+
+    def __init__(
+        self,
+        up=False,
+        down=False,
+        left=False,
+        right=False,
+        zoom_in=False,
+        zoom_out=False,
+        attack=False,
+    ):
+        self.up = up
+        self.down = down
+        self.left = left
+        self.right = right
+        self.zoom_in = zoom_in
+        self.zoom_out = zoom_out
+        self.attack = attack
+
+    def to_bits(self):
+        """Pack the input into a single byte, a bit per field."""
+        bits = 0
+        for bit, field in enumerate(INPUT_FIELDS):
+            if getattr(self, field):
+                bits |= 1 << bit
+        return bits
+
+    @classmethod
+    def from_bits(cls, bits):
+        """Unpack an input packed by to_bits()."""
+        return cls(*(bool(bits & 1 << bit) for bit in range(len(INPUT_FIELDS))))
+
+
+class Controls:
+    """
+    Base input source, `state` holds the input of the current tick and is refreshed once per tick by poll().
+    `finished` is set once a finite source (e.g. a replay) runs out, which ends the game.
+    """
+
+    def __init__(self):
+        self.state = InputState()
+        self.finished = False
+
+    def handle_event(self, event):
+        """Called for every pygame event before polling."""
+        pass
+
+    def poll(self):
+        raise NotImplementedError
+
+
+class KeyboardControls(Controls):
+    """Live input from the keyboard and mouse."""
+
+    def __init__(self):
+        super().__init__()
+        self.attack_pressed = False
+
+    def handle_event(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.attack_pressed = True
+
+    def poll(self):
+        keys = pygame.key.get_pressed()
+        self.state = InputState(
+            keys[pygame.K_w],
+            keys[pygame.K_s],
+            keys[pygame.K_a],
+            keys[pygame.K_d],
+            keys[pygame.K_q],
+            keys[pygame.K_e],
+            self.attack_pressed,
+        )
+        self.attack_pressed = False
+        return self.state
+
+
+class ScriptedControls(Controls):
+    """Scripted input, `script` is called with the tick number and returns the InputState of that tick."""
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = script
+        self.tick = 0
+
+    def poll(self):
+        self.state = self.script(self.tick)
+        self.tick += 1
+        return self.state
+
+
+class HuntControls(Controls):
+    """
+    Scripted AI which walks straight at the nearest enemy and swings the sword once it's within attack_distance.
+    It has to see the game, so attach() is called once the game is created. Deterministic, used by the batch runner.
+    """
+
+    def __init__(self, attack_distance=PLAYER_SPRITE_WIDTH, dead_zone=PLAYER_VEL):
+        super().__init__()
+        self.attack_distance = attack_distance
+        self.dead_zone = dead_zone
+        self.game = None
+
+    def attach(self, game):
+        self.game = game
+
+    def get_nearest_enemy(self, player_sprite):
+        """Helper function to get the nearest living enemy and its distance, (None, None) when there's none."""
+        nearest_enemy = None
+        nearest_distance = None
+        for sprite in self.game.camera_group:
+            if not hasattr(sprite, "enemy_name") or sprite.dying:
+                continue
+            distance = calculate_distance(player_sprite.rect.center, sprite.rect.center)
+            if nearest_distance is None or distance < nearest_distance:
+                nearest_enemy = sprite
+                nearest_distance = distance
+        return nearest_enemy, nearest_distance
+
+    def poll(self):
+        self.state = InputState()
+        player_sprite = self.game.player_sprite if self.game is not None else None
+        if player_sprite is None or not player_sprite.alive():
+            return self.state
+        enemy, distance = self.get_nearest_enemy(player_sprite)
+        if enemy is None:
+            return self.state
+
+        if distance <= self.attack_distance:
+            self.state.attack = True
+        delta_x = enemy.rect.centerx - player_sprite.rect.centerx
+        delta_y = enemy.rect.centery - player_sprite.rect.centery
+        self.state.left = delta_x < -self.dead_zone
+        self.state.right = delta_x > self.dead_zone
+        self.state.up = delta_y < -self.dead_zone
+        self.state.down = delta_y > self.dead_zone
+        return self.state
+
+
+def patrol_script(tick, period=60, attack_period=45):
+    """Deterministic script which walks in a square and swings the sword periodically, used by the benchmark."""
+    side = tick // period % 4
+    return InputState(
+        up=side == 0,
+        right=side == 1,
+        down=side == 2,
+        left=side == 3,
+        attack=tick % attack_period == 0,
+    )
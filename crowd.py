@@ -0,0 +1,68 @@
+import math
+
+from const import *
+
+
+class CrowdGrid:
+    """
+    Uniform grid of the enemy centers, rebuilt once per tick, so separation only looks at the enemies in adjacent cells.
+    Cells are as large as the separation radius, so the 3x3 cells around an enemy hold every neighbour it can be pushed by.
+    """
+
+    def __init__(self, radius=CROWD_SEPARATION_RADIUS):
+        self.radius = radius
+        self.cells = {}
+        self.centers = []
+        self.enemy_indices = {}
+
+    def __len__(self):
+        return len(self.centers)
+
+    def rebuild(self, enemies):
+        """Bucket the current centers of the enemies, called once at the start of every tick."""
+        self.cells.clear()
+        self.centers = []
+        self.enemy_indices = {}
+        radius = self.radius
+        for index, enemy in enumerate(enemies):
+            center_x, center_y = enemy.rect.center
+            self.centers.append((center_x, center_y))
+            self.enemy_indices[enemy] = index
+            self.cells.setdefault((center_x // radius, center_y // radius), []).append(
+                (index, center_x, center_y)
+            )
+
+    def get_separation(self, enemy):
+        """
+        Get the push (x, y) away from the neighbours of an enemy, each neighbour within the radius pushes harder the closer it is.
+        Enemies on the exact same spot are told apart by their order in the grid. Enemies which aren't in the grid aren't pushed.
+        """
+        index = self.enemy_indices.get(enemy)
+        if index is None:
+            return 0.0, 0.0
+        radius = self.radius
+        radius_squared = radius * radius
+        center_x, center_y = self.centers[index]
+        cell_x = center_x // radius
+        cell_y = center_y // radius
+        cells = self.cells
+        push_x = 0.0
+        push_y = 0.0
+        for neighbour_y in (cell_y - 1, cell_y, cell_y + 1):
+            for neighbour_x in (cell_x - 1, cell_x, cell_x + 1):
+                for neighbour_index, other_x, other_y in cells.get(
+                    (neighbour_x, neighbour_y), ()
+                ):
+                    delta_x = center_x - other_x
+                    delta_y = center_y - other_y
+                    distance_squared = delta_x * delta_x + delta_y * delta_y
+                    if distance_squared >= radius_squared or neighbour_index == index:
+                        continue
+                    if distance_squared == 0:
+                        push_x += 1.0 if index > neighbour_index else -1.0
+                        continue
+                    distance = math.sqrt(distance_squared)
+                    strength = (radius - distance) / (radius * distance)
+                    push_x += delta_x * strength
+                    push_y += delta_y * strength
+        return push_x, push_y
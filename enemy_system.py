@@ -0,0 +1,155 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from const import *
+
+
+class EnemySystem:
+    """
+    Optional batched backend for pursuing enemies, requires numpy.
+    Positions, pursuit state and velocity of every enemy are kept in arrays so distance-to-player,
+    alert checks and pursuit steps run in one pass, the results are then written back to the sprites.
+    """
+
+    def __init__(self, player_sprite, flow_field=None, crowd_grid=None):
+        if np is None:
+            raise ImportError("EnemySystem requires numpy to be installed.")
+        self.player_sprite = player_sprite
+        self.flow_field = flow_field
+        self.crowd_grid = crowd_grid
+        self.flow_field_version = None
+        self.flow_distances = np.zeros(0, dtype=int)
+        self.flow_directions = np.zeros((0, 2))
+        self.enemies = []
+        self.centers = np.zeros((0, 2))
+        self.positions = np.zeros((0, 2))
+        self.distances = np.zeros(0)
+        self.pursuing = np.zeros(0, dtype=bool)
+        self.directions = np.zeros((0, 2))
+        self.velocities = np.zeros((0, 2))
+
+    def __len__(self):
+        return len(self.enemies)
+
+    def add(self, enemy):
+        """Hand the alert checks and movement of an enemy over to this system."""
+        enemy.enemy_system = self
+        self.enemies.append(enemy)
+
+    def remove(self, enemy):
+        """Give the alert checks and movement back to the enemy."""
+        enemy.enemy_system = None
+        self.enemies.remove(enemy)
+
+    def gather(self):
+        """Helper function to drop dead enemies and copy the sprite state into the arrays."""
+        self.enemies = [enemy for enemy in self.enemies if enemy.alive()]
+        for enemy in self.enemies:
+            enemy.sync_position()
+        self.centers = np.array(
+            [enemy.rect.center for enemy in self.enemies], dtype=float
+        ).reshape(-1, 2)
+        self.positions = np.array(
+            [enemy.position for enemy in self.enemies], dtype=float
+        ).reshape(-1, 2)
+
+    def handle_alert_radius(self):
+        """Batched version of PursuingEnemy.handle_alert_radius."""
+        deltas = np.array(self.player_sprite.rect.center, dtype=float) - self.centers
+        self.distances = np.sqrt(deltas[:, 0] ** 2 + deltas[:, 1] ** 2)
+        self.pursuing = self.distances <= ENEMY_ALERT_RADIUS
+        return deltas
+
+    def handle_movement(self, deltas):
+        """Batched version of PursuingEnemy.handle_movement, a zero-length direction stays zero."""
+        lengths = self.distances[:, np.newaxis]
+        self.directions = np.divide(
+            deltas, lengths, out=np.zeros_like(deltas), where=lengths != 0
+        )
+        self.handle_steering()
+        self.velocities = np.where(
+            self.pursuing[:, np.newaxis], self.get_moves() * ENEMY_VEL, 0.0
+        )
+        self.positions += self.velocities
+
+    def handle_steering(self):
+        """Batched version of FlowField.get_steering, overrides the directions which would run into an obstacle."""
+        if self.flow_field is None:
+            return
+        if self.flow_field_version != self.flow_field.version:
+            self.flow_distances = np.array(self.flow_field.distances, dtype=int)
+            self.flow_directions = np.array(
+                self.flow_field.directions, dtype=float
+            ).reshape(-1, 2)
+            self.flow_field_version = self.flow_field.version
+        if self.flow_field.target_tile is None:
+            return
+
+        tiles = self.get_tile_indices(self.centers)
+        ahead_tiles = self.get_tile_indices(
+            self.centers + self.directions * self.flow_field.tile_size
+        )
+        tile_distances = np.where(tiles >= 0, self.flow_distances[tiles], -1)
+        ahead_distances = np.where(
+            ahead_tiles >= 0, self.flow_distances[ahead_tiles], -1
+        )
+        straight = (ahead_distances != -1) & (ahead_distances <= tile_distances)
+        steered = (tile_distances > 0) & ~straight
+        self.directions[steered] = self.flow_directions[tiles[steered]]
+
+    def get_moves(self):
+        """Helper function to add the crowd separation of the pursuing enemies to their directions, capped at unit length."""
+        if self.crowd_grid is None or not self.pursuing.any():
+            return self.directions
+        separations = np.zeros_like(self.directions)
+        for index in np.flatnonzero(self.pursuing).tolist():
+            separations[index] = self.crowd_grid.get_separation(self.enemies[index])
+        moves = self.directions + separations * CROWD_SEPARATION_WEIGHT
+        lengths = np.sqrt(moves[:, 0] ** 2 + moves[:, 1] ** 2)[:, np.newaxis]
+        return np.divide(moves, lengths, out=moves, where=lengths > 1)
+
+    def get_tile_indices(self, positions):
+        """Helper function to get the flat flow field tile indices of positions, -1 when outside the map."""
+        tile_positions = np.floor_divide(positions, self.flow_field.tile_size).astype(
+            int
+        )
+        inside = (
+            (tile_positions[:, 0] >= 0)
+            & (tile_positions[:, 0] < self.flow_field.width)
+            & (tile_positions[:, 1] >= 0)
+            & (tile_positions[:, 1] < self.flow_field.height)
+        )
+        return np.where(
+            inside,
+            tile_positions[:, 1] * self.flow_field.width + tile_positions[:, 0],
+            -1,
+        )
+
+    def write_back(self):
+        """Helper function to copy the results back to the sprites, rect centers are rounded from the sub-pixel positions."""
+        for enemy, distance, pursuing, direction, position in zip(
+            self.enemies,
+            self.distances.tolist(),
+            self.pursuing.tolist(),
+            self.directions.tolist(),
+            self.positions.tolist(),
+        ):
+            enemy.distance_to_player = distance
+            enemy.pursuing = pursuing
+            if pursuing:
+                enemy.direction_to_player = direction
+                enemy.position = position
+                enemy.rect.center = (round(position[0]), round(position[1]))
+
+    def update(self):
+        """Run the alert checks and pursuit steps of every enemy, called after the group update."""
+        self.gather()
+        if not self.enemies:
+            return
+        deltas = self.handle_alert_radius()
+        self.handle_movement(deltas)
+        self.write_back()
+        for enemy in self.enemies:
+            enemy.late_update()
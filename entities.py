@@ -0,0 +1,101 @@
+from array import array
+
+import pygame
+
+# Column name and array typecode of every entity field.
+ENTITY_COLUMNS = (
+    ("health", "d"),
+    ("position_x", "d"),
+    ("position_y", "d"),
+    ("direction_x", "d"),
+    ("direction_y", "d"),
+    ("distance", "d"),
+    ("hit_countdown", "i"),
+    ("invisibility_countdown", "i"),
+    ("animation_index", "d"),
+)
+
+
+class EntityStore:
+    """
+    Struct-of-arrays storage of the entity state, each field is an array.array column indexed by an entity row.
+    Entities are thin views over their row through StoreField and StoreVector, rows of dead entities are reused.
+    """
+
+    __slots__ = tuple(name for name, _ in ENTITY_COLUMNS) + ("free_rows",)
+
+    def __init__(self):
+        for name, typecode in ENTITY_COLUMNS:
+            setattr(self, name, array(typecode))
+        self.free_rows = []
+
+    def __len__(self):
+        return len(self.health) - len(self.free_rows)
+
+    def allocate(self):
+        """Get a zeroed row for a new entity."""
+        if self.free_rows:
+            return self.free_rows.pop()
+        for name, _ in ENTITY_COLUMNS:
+            getattr(self, name).append(0)
+        return len(self.health) - 1
+
+    def release(self, row):
+        """Zero a row and make it available to the next entity."""
+        for name, _ in ENTITY_COLUMNS:
+            getattr(self, name)[row] = 0
+        self.free_rows.append(row)
+
+    def detach(self, row):
+        """Move a row into a private single row store, returns the store. Dead entities keep their state without holding on to a shared row."""
+        store = EntityStore()
+        store.allocate()
+        for name, _ in ENTITY_COLUMNS:
+            getattr(store, name)[0] = getattr(self, name)[row]
+        self.release(row)
+        return store
+
+
+class StoreField:
+    """Attribute of an entity stored in a column of its entity store."""
+
+    __slots__ = ("column",)
+
+    def __init__(self, column):
+        self.column = column
+
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        return getattr(entity.entity_store, self.column)[entity.entity_row]
+
+    def __set__(self, entity, value):
+        getattr(entity.entity_store, self.column)[entity.entity_row] = value
+
+
+class StoreVector:
+    """
+    Vector attribute of an entity stored in a pair of columns (prefix_x and prefix_y) of its entity store.
+    Reading it gives a copy, so it has to be assigned back after being changed in place.
+    """
+
+    __slots__ = ("column_x", "column_y")
+
+    def __init__(self, prefix):
+        self.column_x = f"{prefix}_x"
+        self.column_y = f"{prefix}_y"
+
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        store = entity.entity_store
+        row = entity.entity_row
+        return pygame.math.Vector2(
+            getattr(store, self.column_x)[row], getattr(store, self.column_y)[row]
+        )
+
+    def __set__(self, entity, value):
+        store = entity.entity_store
+        row = entity.entity_row
+        getattr(store, self.column_x)[row] = value[0]
+        getattr(store, self.column_y)[row] = value[1]
@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from time import perf_counter
+
+import pygame
+
+from mapcache import load_map_data, read_fresh_map_cache, read_chunk_bytes
+from assets import registry
+from const import *
+
+
+def read_level(tmx_path, read_chunks=True):
+    """
+    Read the map data of a level and the pixels of its chunks from its compiled cache, safe to call from a background thread.
+    Returns the map data and the {chunk pos: RGBA bytes} of its chunks, which still have to be turned into surfaces,
+    or None when the cache is missing or stale since compiling a map creates surfaces.
+    """
+    map_data = read_fresh_map_cache(tmx_path, load_chunks=False)
+    if map_data is None:
+        return None
+    chunk_bytes = {}
+    if read_chunks:
+        for chunk_pos, offset in map_data.chunk_offsets.items():
+            chunk_bytes[chunk_pos] = read_chunk_bytes(
+                map_data.cache_path, offset, map_data.static_layer.chunk_size
+            )
+    return map_data, chunk_bytes
+
+
+class LevelManager:
+    """
+    Plays the levels in order, the next level is prepared while the current one is played.
+    Every level is compiled into the map cache on the main thread at startup, if it isn't already.
+    The next level's map data and chunk pixels are read from the cache on a background thread, then turned into tile
+    surfaces and enemy frames on the main thread, in steps of at most LEVEL_PRELOAD_BUDGET_MS per frame. Touching an
+    exit trigger switches to it, only finishing what's left on the spot if it isn't prepared yet. Enemy frames the new
+    level doesn't use are evicted.
+    Levels without an exit trigger have no next level.
+    """
+
+    def __init__(self, game, levels=LEVELS):
+        self.game = game
+        self.levels = [path.normpath(level) for level in levels]
+        self.level = None
+        self.exit_rects = []
+        self.executor = ThreadPoolExecutor(1)
+
+        # Next level, its background read and what's left to do on the main thread.
+        self.next_level = None
+        self.future = None
+        self.next_map_data = None
+        self.pending_chunks = []
+        self.pending_enemies = []
+        self.switches = 0
+        self.last_switch_time = 0.0
+
+    def get_next_level(self, tmx_path):
+        """Get the level after tmx_path, the last level loops back to the first. Maps which aren't levels lead to the first."""
+        tmx_path = path.normpath(tmx_path)
+        if tmx_path not in self.levels:
+            return self.levels[0]
+        return self.levels[(self.levels.index(tmx_path) + 1) % len(self.levels)]
+
+    def start(self, tmx_path):
+        """Load the first level synchronously, compile the other levels and start preparing the one after it."""
+        self.game.load_map(tmx_path)
+        self.compile_levels()
+        self.enter(tmx_path)
+
+    def compile_levels(self):
+        """Helper function to compile the levels whose cache is missing or stale, fresh caches are only opened."""
+        for level in self.levels:
+            load_map_data(level, load_chunks=False)
+
+    def enter(self, tmx_path):
+        """Helper function to start playing the level the game has just loaded."""
+        self.level = tmx_path
+        self.exit_rects = [
+            pygame.Rect(x, y, width, height)
+            for name, x, y, width, height in self.game.map_data.triggers
+            if name == EXIT_TRIGGER
+        ]
+        if self.exit_rects:
+            self.prepare(self.get_next_level(tmx_path))
+
+    def prepare(self, tmx_path):
+        """Start preparing a level in the background, while streaming its chunks are left to the streamer."""
+        self.next_level = tmx_path
+        self.next_map_data = None
+        self.pending_chunks = []
+        self.pending_enemies = []
+        self.future = self.executor.submit(
+            read_level, tmx_path, not self.game.streaming
+        )
+
+    def step(self, budget=None):
+        """
+        Helper function to prepare the next level for up to budget seconds, or until it's ready without a budget.
+        Returns whether the next level is ready.
+        """
+        if self.future is None:
+            return False
+        if self.next_map_data is None:
+            if budget is not None and not self.future.done():
+                return False
+            level = self.future.result()
+            if level is None:
+                # Without a fresh cache (e.g. a read-only checkout), the map is compiled and loaded here instead.
+                level = (
+                    load_map_data(self.next_level, load_chunks=not self.game.streaming),
+                    {},
+                )
+            self.next_map_data, chunk_bytes = level
+            self.pending_chunks = sorted(chunk_bytes.items(), reverse=True)
+            self.pending_enemies = sorted(
+                {name for name, _, _ in self.next_map_data.enemies}, reverse=True
+            )
+
+        # At least one chunk or enemy is prepared per step, so a tight budget still makes progress.
+        deadline = perf_counter() + budget if budget is not None else None
+        static_layer = self.next_map_data.static_layer
+        while self.pending_chunks or self.pending_enemies:
+            if self.pending_chunks:
+                static_layer.load_chunk(*self.pending_chunks.pop())
+            else:
+                registry.preload_enemies((self.pending_enemies.pop(),))
+            if deadline is not None and perf_counter() >= deadline:
+                break
+        return not self.pending_chunks and not self.pending_enemies
+
+    def update(self):
+        """Prepare the next level within LEVEL_PRELOAD_BUDGET_MS, called once per rendered frame."""
+        self.step(LEVEL_PRELOAD_BUDGET_MS / 1000)
+
+    def handle_exit(self):
+        """Switch to the next level when the player touches an exit, called after every simulation tick."""
+        player_sprite = self.game.player_sprite
+        if (
+            self.future is None
+            or player_sprite.dying
+            or not player_sprite.alive()
+            or player_sprite.rect.collidelist(self.exit_rects) == -1
+        ):
+            return
+        self.switch()
+
+    def switch(self):
+        """Switch to the next level, finishing its preparation first if needed."""
+        start = perf_counter()
+        self.step()
+        tmx_path = self.next_level
+        map_data = self.next_map_data
+        self.future = None
+        self.next_level = None
+        self.next_map_data = None
+
+        self.game.load_map(tmx_path, map_data)
+        registry.evict_enemies({name for name, _, _ in map_data.enemies})
+        self.switches += 1
+        self.last_switch_time = perf_counter() - start
+        self.enter(tmx_path)
+
+    def get_stats(self):
+        """Get the current and next level, the number of switches and how long the last one took."""
+        return {
+            "level": self.level,
+            "next_level": self.next_level,
+            "next_level_ready": self.future is not None
+            and self.next_map_data is not None
+            and not self.pending_chunks
+            and not self.pending_enemies,
+            "switches": self.switches,
+            "last_switch_ms": self.last_switch_time * 1000,
+        }
+
+    def close(self):
+        """Stop the background thread, a pending read is dropped."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,88 +1,384 @@
+from time import perf_counter
+
+# Start of the module imports, for --startup-profile.
+IMPORT_START = perf_counter()
+
+import argparse
+import json
 from os import path
 
 import pygame
-from pytmx import load_pygame
 
-from config import screen, clock
-from sprites import Trigger, Tile, AnimatedPursuingEnemy, Player, CameraGroup
+from config import init_display, HEADLESS
+from sprites import Trigger, AnimatedPursuingEnemy, Player, CameraGroup
+from mapcache import load_map_data
+from streaming import WorldStreamer
+from activity import ActivityScheduler
+from assets import registry
+from audio import sound_bank
+from pathfinding import FlowField
+from crowd import CrowdGrid
+from levels import LevelManager
+from controls import KeyboardControls
+from recording import (
+    InputRecording,
+    RecordingControls,
+    ReplayControls,
+    read_input_recording,
+    write_input_recording,
+)
+from profiler import profiler
+from overlay import PerformanceOverlay
 from const import *
 
 
 class Game:
-    def load_tiles_and_triggers(self, tmx_data, group):
+    def __init__(
+        self,
+        controls=None,
+        use_enemy_system=USE_ENEMY_SYSTEM,
+        streaming=USE_STREAMING,
+        use_activity_scheduler=USE_ACTIVITY_SCHEDULER,
+        use_projectiles=USE_PROJECTILES,
+        use_crowd_separation=USE_CROWD_SEPARATION,
+    ):
+        self.controls = controls if controls is not None else KeyboardControls()
+        self.use_enemy_system = use_enemy_system
+        self.streaming = streaming
+        self.use_activity_scheduler = use_activity_scheduler
+        self.use_projectiles = use_projectiles
+        self.use_crowd_separation = use_crowd_separation
+        self.map_data = None
+        self.camera_group = None
+        self.player_sprite = None
+        self.enemy_system = None
+        self.crowd_grid = None
+        self.activity_scheduler = None
+        self.projectile_system = None
+        self.streamer = None
+        self.level_manager = None
+        self.overlay = None
+        self.running = False
+
+        # Seconds spent in every startup phase of run(), see --startup-profile.
+        self.startup_times = {}
+
+    def load_tiles_and_triggers(self, map_data, group):
         """Helper function to load tiles and triggers into group."""
-        for layer in tmx_data.layers:
-            if hasattr(layer, "data"):
-                for x, y, image in layer.tiles():
-                    Tile((x * TILE_SIZE, y * TILE_SIZE), image, group)
-        for obj in tmx_data.objects:
-            if obj.name == HAZARD_TRIGGER:
-                Trigger(
-                    (obj.x, obj.y),
-                    obj.width,
-                    obj.height,
-                    group,
-                    HAZARD_TRIGGER,
-                    HAZARD_TRIGGER_DEBUG_COLOR,
-                )
-            if obj.name == OBSTACLE_TRIGGER:
-                Trigger(
-                    (obj.x, obj.y),
-                    obj.width,
-                    obj.height,
-                    group,
-                    OBSTACLE_TRIGGER,
-                    OBSTACLE_TRIGGER_DEBUG_COLOR,
-                )
-
-    def load_enemies(self, player_sprite, tmx_data, group):
-        """Helper function to load enemies into group."""
-        for obj in tmx_data.objects:
-            if obj.type == "enemy":
-                AnimatedPursuingEnemy(
-                    obj.name, (obj.x, obj.y), player_sprite, group, 3, 2
-                )
-
-    def run(self):
-        """Main function to run the game."""
-        # Disabling cursor.
-        pygame.mouse.set_visible(False)
+        # Tiles are baked into chunks once instead of being a sprite each.
+        group.static_layer = map_data.static_layer
+        for name, x, y, width, height in map_data.triggers:
+            self.spawn_trigger(name, (x, y), width, height, group)
+
+    def spawn_trigger(self, name, pos, width, height, group):
+        """Helper function to spawn a single hazard or obstacle trigger, returns None for any other name."""
+        if name == HAZARD_TRIGGER:
+            color = HAZARD_TRIGGER_DEBUG_COLOR
+        elif name == OBSTACLE_TRIGGER:
+            color = OBSTACLE_TRIGGER_DEBUG_COLOR
+        else:
+            return None
+        trigger = Trigger(pos, width, height, group, name, color)
+        group.trigger_index.insert(trigger, trigger.rect)
+        return trigger
+
+    def load_enemies(self, player_sprite, map_data, group, enemy_system=None):
+        """Helper function to load enemies into group, and into the enemy system if there's one."""
+        # Decode every enemy type once before spawning, instances share the frames.
+        registry.preload_enemies({name for name, _, _ in map_data.enemies})
+        for name, x, y in map_data.enemies:
+            self.spawn_enemy(name, (x, y), player_sprite, group, enemy_system)
+
+    def spawn_enemy(self, enemy_name, pos, player_sprite, group, enemy_system=None):
+        """Helper function to spawn a single enemy."""
+        enemy = AnimatedPursuingEnemy(enemy_name, pos, player_sprite, group, 3, 2)
+        if enemy_system is not None:
+            enemy_system.add(enemy)
+        if group.activity_scheduler is not None:
+            group.activity_scheduler.add(enemy)
+        return enemy
 
-        tmx_data = load_pygame(path.join("maps", "tmx", "open_island.tmx"))
-        camera_group = CameraGroup()
+    def load_map(self, tmx_path, map_data=None):
+        """
+        Load a TMX map with its player and enemies, replacing the current one. The compiled cache is used when it's fresh.
+        While streaming, only the chunks around the player are loaded, see streaming.WorldStreamer.
+        The map data can be given when it's already loaded, e.g. by levels.LevelManager.
+        """
+        # Tiles and sprites are converted to the display format, so the window has to be open first.
+        init_display()
+        if self.streamer is not None:
+            self.streamer.close()
+            self.streamer = None
+        self.map_data = (
+            map_data
+            if map_data is not None
+            else load_map_data(tmx_path, load_chunks=not self.streaming)
+        )
+        if self.map_data.player_spawn is None:
+            raise ValueError(f"{tmx_path} has no {PLAYER_SPAWN} object.")
+        self.camera_group = CameraGroup(self.controls)
 
-        # Load tiles and triggers into the group.
-        self.load_tiles_and_triggers(tmx_data, camera_group)
+        # Load tiles and triggers into the group, the streamer loads them chunk by chunk instead.
+        if self.streaming:
+            self.camera_group.static_layer = self.map_data.static_layer
+        else:
+            self.load_tiles_and_triggers(self.map_data, self.camera_group)
+        self.camera_group.flow_field = FlowField.from_map_data(self.map_data)
+        self.crowd_grid = CrowdGrid() if self.use_crowd_separation else None
+        self.camera_group.crowd_grid = self.crowd_grid
 
-        player_spawn = tmx_data.get_object_by_name(PLAYER_SPAWN)
-        player_sprite = Player((player_spawn.x, player_spawn.y), camera_group, 3, 2)
+        self.player_sprite = Player(
+            self.map_data.player_spawn, self.camera_group, self.controls, 3, 2
+        )
+
+        # Optional batched backend for enemy alert checks and movement.
+        # The NumPy backends are imported on first use, so numpy isn't loaded unless one is on.
+        self.enemy_system = None
+        if self.use_enemy_system:
+            from enemy_system import EnemySystem
+
+            self.enemy_system = EnemySystem(
+                self.player_sprite, self.camera_group.flow_field, self.crowd_grid
+            )
+
+        # Distant idle enemies are ticked at a reduced rate or put to sleep.
+        self.activity_scheduler = (
+            ActivityScheduler(self.camera_group, self.player_sprite, self.enemy_system)
+            if self.use_activity_scheduler
+            else None
+        )
+        self.camera_group.activity_scheduler = self.activity_scheduler
+
+        # Optional pooled projectiles for the bullet-hell attacks.
+        self.projectile_system = None
+        if self.use_projectiles:
+            from projectiles import ProjectileSystem
+
+            self.projectile_system = ProjectileSystem.from_map_data(
+                self.map_data, self.camera_group, self.player_sprite
+            )
+        self.camera_group.projectile_system = self.projectile_system
 
         # Load enemies into the group, called after player_sprite has been initiated.
-        self.load_enemies(player_sprite, tmx_data, camera_group)
+        if self.streaming:
+            self.streamer = WorldStreamer(self, self.map_data)
+            self.streamer.update(self.player_sprite.rect.center, wait=True)
+        else:
+            self.load_enemies(
+                self.player_sprite, self.map_data, self.camera_group, self.enemy_system
+            )
 
-        # Main loop.
-        running = True
-        while running:
+    def handle_events(self):
+        """Pump the event queue into the controls, called once per rendered frame."""
+        with profiler.scope("events"):
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    running = False
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:
-                        player_sprite.fire_attack()
+                    self.running = False
+                elif (
+                    event.type == pygame.KEYDOWN
+                    and self.overlay is not None
+                    and event.key == pygame.key.key_code(PROFILER_OVERLAY_KEY)
+                ):
+                    self.overlay.toggle()
+                self.controls.handle_event(event)
+
+    def get_moving_enemies(self):
+        """Helper function to get the enemies which may move this tick, i.e. the nearby ones when the activity scheduler runs."""
+        if self.activity_scheduler is not None:
+            return list(self.activity_scheduler.nearby_enemies)
+        return [
+            sprite
+            for sprite in self.camera_group.awake_sprites
+            if hasattr(sprite, "enemy_name")
+        ]
 
-            # Prevent frame artifact.
-            screen.fill(BACKGROUND_COLOR)
+    def update(self):
+        """Advance the game by a single fixed simulation tick."""
+        with profiler.scope("update"):
+            if self.controls.poll().attack:
+                self.player_sprite.fire_attack()
+            if self.streamer is not None:
+                self.streamer.update(self.player_sprite.rect.center)
+            if self.crowd_grid is not None:
+                self.crowd_grid.rebuild(self.get_moving_enemies())
+            if self.activity_scheduler is not None:
+                self.activity_scheduler.update()
 
-            camera_group.camera_draw(player_sprite)
-            camera_group.update()
+            self.camera_group.store_previous_positions()
+            self.camera_group.flow_field.update(self.player_sprite.rect.center)
+            self.camera_group.update()
+            if self.enemy_system is not None:
+                self.enemy_system.update()
+            if self.projectile_system is not None:
+                with profiler.scope("projectiles"):
+                    self.projectile_system.update()
+            if self.level_manager is not None:
+                self.level_manager.handle_exit()
+
+    def draw(self, interpolation=1.0):
+        """Render the current state to the screen, interpolating sprites between the last two ticks."""
+        with profiler.scope("draw"):
+            # The camera covers the whole screen, so there's no need to clear it first.
+            self.camera_group.camera_draw(self.player_sprite, interpolation)
+            if self.overlay is not None:
+                self.overlay.draw(self.camera_group.screen, self.camera_group)
+        with profiler.scope("flip"):
             pygame.display.flip()
-            clock.tick(60)
+
+    def run_startup_phase(self, name, function, *args):
+        """Helper function to run a phase of the startup and store how long it took in startup_times."""
+        start = perf_counter()
+        result = function(*args)
+        self.startup_times[name] = perf_counter() - start
+        return result
+
+    def preload_assets(self):
+        """Decode the assets every map needs ahead of time, the enemies of a map are decoded when it's loaded."""
+        Player.load_assets()
+
+    def run(
+        self,
+        tmx_path=path.join("maps", "tmx", "open_island.tmx"),
+        trace_path=None,
+        startup_profile=False,
+    ):
+        """
+        Main function to run the game, the profiler trace is written to trace_path on exit when there's one.
+        The game ends when the window is closed or the controls are finished (e.g. at the end of a replay),
+        or after the first frame when profiling the startup.
+        """
+        self.run_startup_phase("display", init_display)
+
+        # Disabling cursor.
+        pygame.mouse.set_visible(False)
+
+        # Sound effects are decoded in the background while the map loads.
+        sound_bank.preload()
+
+        # Frame time overlay, toggled with PROFILER_OVERLAY_KEY.
+        self.overlay = PerformanceOverlay()
+        if trace_path is not None:
+            profiler.start_tracing()
+
+        self.run_startup_phase("assets", self.preload_assets)
+
+        # The next level is prepared in the background while this one is played.
+        self.level_manager = LevelManager(self)
+        self.run_startup_phase("map", self.level_manager.start, tmx_path)
+
+        # Main loop, the simulation runs in fixed ticks decoupled from the render frame rate.
+        self.running = True
+        clock = pygame.time.Clock()
+        accumulator = 0.0
+        skipped_frames = 0
+        first_frame_start = perf_counter()
+        while self.running:
+            profiler.next_frame()
+
+            # Headless runs advance a single tick per frame as fast as possible, e.g. to replay faster than real time.
+            if HEADLESS:
+                accumulator += FIXED_TIMESTEP
+            else:
+                accumulator += min(clock.tick(MAX_RENDER_FPS) / 1000, MAX_FRAME_TIME)
+
+            self.handle_events()
+            ticks = 0
+            while (
+                accumulator >= FIXED_TIMESTEP
+                and ticks < MAX_TICKS_PER_FRAME
+                and not self.controls.finished
+            ):
+                self.update()
+                accumulator -= FIXED_TIMESTEP
+                ticks += 1
+            if self.controls.finished:
+                self.running = False
+            self.level_manager.update()
+
+            # Under load, skip rendering a few frames to catch up, then drop the backlog instead of spiralling.
+            if accumulator >= FIXED_TIMESTEP:
+                if skipped_frames < MAX_SKIPPED_FRAMES:
+                    skipped_frames += 1
+                    continue
+                accumulator %= FIXED_TIMESTEP
+            skipped_frames = 0
+
+            self.draw(accumulator / FIXED_TIMESTEP)
+            if "first_frame" not in self.startup_times:
+                self.startup_times["first_frame"] = perf_counter() - first_frame_start
+                if startup_profile:
+                    self.running = False
 
         # Exit the program.
+        self.level_manager.close()
+        if trace_path is not None:
+            profiler.export_trace(trace_path)
         pygame.quit()
-        quit(0)
+
+    def get_startup_report(self, import_time=None):
+        """Get the startup phase times in milliseconds and the number of decoded spritesheets."""
+        times = {} if import_time is None else {"imports": import_time}
+        times.update(self.startup_times)
+        return {
+            "ms": {name: time * 1000 for name, time in times.items()}
+            | {"total": sum(times.values()) * 1000},
+            "assets": registry.get_stats(),
+        }
 
 
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    import_time = perf_counter() - IMPORT_START
+    parser = argparse.ArgumentParser(description="Dungeon Breakout.")
+    parser.add_argument("--map", default=path.join("maps", "tmx", "open_island.tmx"))
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Profile the session and write a Chrome trace (chrome://tracing, Perfetto) on exit.",
+    )
+    record_group = parser.add_mutually_exclusive_group()
+    record_group.add_argument(
+        "--record",
+        metavar="PATH",
+        help="Record the input of every tick to a file on exit.",
+    )
+    record_group.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="Replay a recorded session with its map and settings, run headless to replay faster than real time.",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Print how long the imports, assets, map and first frame took, then exit.",
+    )
+    args = parser.parse_args()
+
+    if args.replay:
+        recording = read_input_recording(args.replay)
+        game = Game(
+            ReplayControls(recording),
+            recording.use_enemy_system,
+            recording.streaming,
+            recording.use_activity_scheduler,
+            recording.use_projectiles,
+            recording.use_crowd_separation,
+        )
+        game.run(recording.tmx_path, args.trace, args.startup_profile)
+    elif args.record:
+        recording = InputRecording(args.map)
+        game = Game(
+            RecordingControls(KeyboardControls(), recording),
+            recording.use_enemy_system,
+            recording.streaming,
+            recording.use_activity_scheduler,
+            recording.use_projectiles,
+            recording.use_crowd_separation,
+        )
+        game.run(args.map, args.trace, args.startup_profile)
+        write_input_recording(recording, args.record)
+    else:
+        game = Game()
+        game.run(args.map, args.trace, args.startup_profile)
+
+    if args.startup_profile:
+        print(json.dumps(game.get_startup_report(import_time), indent=2))
@@ -0,0 +1,363 @@
+"""
+Compiled map cache, e.g. python mapcache.py maps/tmx/open_island.tmx
+
+Layout of a compiled map, little-endian:
+    header          magic, version, tile size, chunk size, width and height in tiles, dependency count
+    dependencies    path, mtime and size of the TMX map, its tilesets and their images
+    strings         names shared by the triggers and enemies
+    spawn           whether the map has a player spawn, and its position
+    triggers        packed (name index, x, y, width, height) records
+    enemies         packed (name index, x, y) records
+    chunks          (chunk x, chunk y, offset) table followed by the RGBA pixels of every baked chunk
+"""
+
+import mmap
+import struct
+import sys
+from os import path, makedirs, replace, stat, getpid
+from xml.etree import ElementTree
+
+from tilemap import StaticLayer
+from const import *
+
+MAGIC = b"DBMC"
+HEADER_STRUCT = struct.Struct("<4sHHHIIH")
+LENGTH_STRUCT = struct.Struct("<H")
+COUNT_STRUCT = struct.Struct("<I")
+DEPENDENCY_STRUCT = struct.Struct("<qq")
+SPAWN_STRUCT = struct.Struct("<?dd")
+TRIGGER_STRUCT = struct.Struct("<Hdddd")
+ENEMY_STRUCT = struct.Struct("<Hdd")
+CHUNK_STRUCT = struct.Struct("<iiQ")
+
+
+class MapData:
+    """
+    Everything the game needs from a map, either parsed from a TMX map or read from its compiled cache.
+    Triggers are (name, x, y, width, height) tuples, enemies are (name, x, y) tuples and positions are in pixels.
+    When the map has a cache, chunk_offsets maps chunk coordinates to the offsets of their pixels in it.
+    """
+
+    def __init__(
+        self,
+        width,
+        height,
+        static_layer,
+        triggers,
+        player_spawn,
+        enemies,
+        cache_path=None,
+        chunk_offsets=None,
+    ):
+        self.width = width
+        self.height = height
+        self.static_layer = static_layer
+        self.triggers = triggers
+        self.player_spawn = player_spawn
+        self.enemies = enemies
+        self.cache_path = cache_path
+        self.chunk_offsets = chunk_offsets if chunk_offsets is not None else {}
+
+    @classmethod
+    def from_tmx(cls, tmx_data):
+        """Extract the map data of a pytmx map, tiles are baked into chunks."""
+        triggers = []
+        player_spawn = None
+        enemies = []
+        for obj in tmx_data.objects:
+            if obj.type == "enemy":
+                enemies.append((obj.name, obj.x, obj.y))
+            elif obj.name == PLAYER_SPAWN:
+                player_spawn = (obj.x, obj.y)
+            elif obj.name:
+                triggers.append((obj.name, obj.x, obj.y, obj.width, obj.height))
+        return cls(
+            tmx_data.width,
+            tmx_data.height,
+            StaticLayer.from_tmx(tmx_data),
+            triggers,
+            player_spawn,
+            enemies,
+        )
+
+
+class BufferReader:
+    """Helper class to unpack consecutive records from a buffer."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = 0
+
+    def unpack(self, record_struct):
+        """Unpack a single record."""
+        values = record_struct.unpack_from(self.buffer, self.offset)
+        self.offset += record_struct.size
+        return values
+
+    def unpack_array(self, record_struct):
+        """Unpack a count prefixed array of records at once."""
+        (count,) = self.unpack(COUNT_STRUCT)
+        end = self.offset + record_struct.size * count
+        records = list(record_struct.iter_unpack(self.buffer[self.offset : end]))
+        self.offset = end
+        return records
+
+    def read_string(self):
+        """Read a length prefixed UTF-8 string."""
+        (length,) = self.unpack(LENGTH_STRUCT)
+        string = bytes(self.buffer[self.offset : self.offset + length]).decode()
+        self.offset += length
+        return string
+
+
+def pack_string(string):
+    """Helper function to pack a length prefixed UTF-8 string."""
+    data = string.encode()
+    return LENGTH_STRUCT.pack(len(data)) + data
+
+
+def get_cache_path(tmx_path, cache_dir=MAP_CACHE_DIR):
+    """Get the path of the compiled cache of a TMX map."""
+    name = path.splitext(path.basename(tmx_path))[0]
+    return path.join(cache_dir, name + MAP_CACHE_EXTENSION)
+
+
+def get_dependencies(tmx_path, tmx_data):
+    """Get the files a compiled map depends on, i.e. the TMX map, its external tilesets and their images."""
+    map_dir = path.dirname(tmx_path)
+    dependencies = [tmx_path]
+    for tileset in ElementTree.parse(tmx_path).getroot().iter("tileset"):
+        if "source" in tileset.attrib:
+            dependencies.append(path.join(map_dir, tileset.attrib["source"]))
+
+    # pytmx resolves tileset images relative to the map directory.
+    for tileset in tmx_data.tilesets:
+        if tileset.source:
+            dependencies.append(path.join(map_dir, tileset.source))
+    return [path.normpath(dependency) for dependency in dependencies]
+
+
+def parse_map(tmx_path):
+    """Parse a TMX map, returns its map data and dependencies."""
+    # pytmx is only needed when a map isn't compiled yet, so it isn't imported with the module.
+    from pytmx import load_pygame
+
+    tmx_data = load_pygame(tmx_path)
+    return MapData.from_tmx(tmx_data), get_dependencies(tmx_path, tmx_data)
+
+
+def compile_map(tmx_path, cache_path=None):
+    """Parse a TMX map and write its compiled cache, returns the map data."""
+    map_data, dependencies = parse_map(tmx_path)
+    if cache_path is None:
+        cache_path = get_cache_path(tmx_path)
+    map_data.chunk_offsets = write_map_cache(map_data, dependencies, cache_path)
+    map_data.cache_path = cache_path
+    return map_data
+
+
+def write_map_cache(map_data, dependencies, cache_path):
+    """Write map data to a compiled cache file, returns the chunk offsets."""
+    static_layer = map_data.static_layer
+    parts = [
+        HEADER_STRUCT.pack(
+            MAGIC,
+            MAP_CACHE_VERSION,
+            TILE_SIZE,
+            static_layer.chunk_size,
+            map_data.width,
+            map_data.height,
+            len(dependencies),
+        )
+    ]
+    for dependency in dependencies:
+        dependency_stat = stat(dependency)
+        parts.append(pack_string(dependency))
+        parts.append(
+            DEPENDENCY_STRUCT.pack(dependency_stat.st_mtime_ns, dependency_stat.st_size)
+        )
+
+    # Names are stored once and referenced by index.
+    names = sorted(
+        {trigger[0] for trigger in map_data.triggers}
+        | {enemy[0] for enemy in map_data.enemies}
+    )
+    name_indices = {name: index for index, name in enumerate(names)}
+    parts.append(COUNT_STRUCT.pack(len(names)))
+    parts.extend(pack_string(name) for name in names)
+
+    spawn = map_data.player_spawn
+    parts.append(
+        SPAWN_STRUCT.pack(spawn is not None, *(spawn if spawn is not None else (0, 0)))
+    )
+    parts.append(COUNT_STRUCT.pack(len(map_data.triggers)))
+    parts.extend(
+        TRIGGER_STRUCT.pack(name_indices[name], x, y, width, height)
+        for name, x, y, width, height in map_data.triggers
+    )
+    parts.append(COUNT_STRUCT.pack(len(map_data.enemies)))
+    parts.extend(
+        ENEMY_STRUCT.pack(name_indices[name], x, y) for name, x, y in map_data.enemies
+    )
+
+    # Chunk pixels follow the offset table, offsets are from the start of the file.
+    chunk_positions = sorted(static_layer.chunks)
+    parts.append(COUNT_STRUCT.pack(len(chunk_positions)))
+    offset = sum(len(part) for part in parts) + CHUNK_STRUCT.size * len(chunk_positions)
+    chunk_size_bytes = static_layer.chunk_size * static_layer.chunk_size * 4
+    chunk_offsets = {}
+    for chunk_x, chunk_y in chunk_positions:
+        parts.append(CHUNK_STRUCT.pack(chunk_x, chunk_y, offset))
+        chunk_offsets[(chunk_x, chunk_y)] = offset
+        offset += chunk_size_bytes
+    parts.extend(
+        static_layer.get_chunk_bytes(chunk_pos) for chunk_pos in chunk_positions
+    )
+
+    # Write to a temporary file first, so a concurrent reader never sees a partial cache.
+    makedirs(path.dirname(cache_path) or ".", exist_ok=True)
+    temporary_path = f"{cache_path}.{getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(b"".join(parts))
+    replace(temporary_path, cache_path)
+    return chunk_offsets
+
+
+def is_dependency_fresh(dependency, mtime_ns, size):
+    """Helper function to check if a dependency is unchanged since the cache was compiled."""
+    try:
+        dependency_stat = stat(dependency)
+    except OSError:
+        return False
+    return dependency_stat.st_mtime_ns == mtime_ns and dependency_stat.st_size == size
+
+
+def read_map_cache(cache_path, tmx_path=None, load_chunks=True):
+    """
+    Read a compiled cache with a single bulk read, returns None when it's missing, stale, or from another version.
+    Without load_chunks, only the records are read through a memory map and the chunks are left for streaming.
+    """
+    try:
+        with open(cache_path, "rb") as file:
+            if load_chunks:
+                return parse_map_cache(
+                    memoryview(file.read()), cache_path, tmx_path, True
+                )
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return parse_map_cache(buffer, cache_path, tmx_path, False)
+    except OSError:
+        return None
+
+
+def read_chunk_bytes(cache_path, offset, chunk_size):
+    """Read the RGBA pixels of a single chunk from a compiled cache, safe to call from a background thread."""
+    with open(cache_path, "rb") as file:
+        file.seek(offset)
+        return file.read(chunk_size * chunk_size * 4)
+
+
+def parse_map_cache(buffer, cache_path, tmx_path, load_chunks):
+    """Helper function to parse the contents of a compiled cache."""
+    reader = BufferReader(buffer)
+    magic, version, tile_size, chunk_size, width, height, dependency_count = (
+        reader.unpack(HEADER_STRUCT)
+    )
+    if (
+        magic != MAGIC
+        or version != MAP_CACHE_VERSION
+        or tile_size != TILE_SIZE
+        or chunk_size != TILES_PER_CHUNK * TILE_SIZE
+    ):
+        return None
+
+    dependencies = []
+    for _ in range(dependency_count):
+        dependency = reader.read_string()
+        if not is_dependency_fresh(dependency, *reader.unpack(DEPENDENCY_STRUCT)):
+            return None
+        dependencies.append(dependency)
+    if tmx_path is not None and path.normpath(tmx_path) not in dependencies:
+        return None
+
+    (name_count,) = reader.unpack(COUNT_STRUCT)
+    names = [reader.read_string() for _ in range(name_count)]
+    has_spawn, spawn_x, spawn_y = reader.unpack(SPAWN_STRUCT)
+    triggers = [
+        (names[name_index], x, y, trigger_width, trigger_height)
+        for name_index, x, y, trigger_width, trigger_height in reader.unpack_array(
+            TRIGGER_STRUCT
+        )
+    ]
+    enemies = [
+        (names[name_index], x, y)
+        for name_index, x, y in reader.unpack_array(ENEMY_STRUCT)
+    ]
+
+    static_layer = StaticLayer(chunk_size)
+    chunk_offsets = {}
+    chunk_size_bytes = chunk_size * chunk_size * 4
+    for chunk_x, chunk_y, offset in reader.unpack_array(CHUNK_STRUCT):
+        chunk_offsets[(chunk_x, chunk_y)] = offset
+        if load_chunks:
+            static_layer.load_chunk(
+                (chunk_x, chunk_y), buffer[offset : offset + chunk_size_bytes]
+            )
+
+    return MapData(
+        width,
+        height,
+        static_layer,
+        triggers,
+        (spawn_x, spawn_y) if has_spawn else None,
+        enemies,
+        cache_path,
+        chunk_offsets,
+    )
+
+
+def read_fresh_map_cache(tmx_path, cache_dir=MAP_CACHE_DIR, load_chunks=True):
+    """
+    Read the compiled cache of a TMX map, returns None when it's missing, stale or corrupted.
+    Unlike load_map_data it never parses the TMX map, so without load_chunks it creates no surface and is safe to call
+    from a background thread.
+    """
+    try:
+        return read_map_cache(
+            get_cache_path(tmx_path, cache_dir), tmx_path, load_chunks
+        )
+    except (struct.error, ValueError, IndexError):
+        # A corrupted cache is recompiled like a stale one.
+        return None
+
+
+def load_map_data(tmx_path, cache_dir=MAP_CACHE_DIR, load_chunks=True):
+    """
+    Load a map from its compiled cache, falling back to the TMX map and recompiling when the cache is stale.
+    Without load_chunks the chunks are left in the cache for streaming, unless the cache can't be written.
+    """
+    cache_path = get_cache_path(tmx_path, cache_dir)
+    map_data = read_fresh_map_cache(tmx_path, cache_dir, load_chunks)
+    if map_data is not None:
+        return map_data
+
+    map_data, dependencies = parse_map(tmx_path)
+
+    # The cache is only an optimization, a read-only checkout still runs from the TMX map.
+    try:
+        map_data.chunk_offsets = write_map_cache(map_data, dependencies, cache_path)
+    except OSError:
+        return map_data
+    map_data.cache_path = cache_path
+    if not load_chunks:
+        map_data.static_layer.chunks.clear()
+    return map_data
+
+
+if __name__ == "__main__":
+    from config import init_display
+
+    # Baking the chunks converts the tileset images to the display format.
+    init_display()
+    for tmx_path in sys.argv[1:]:
+        compile_map(tmx_path)
+        print(f"Compiled {tmx_path} to {get_cache_path(tmx_path)}")
@@ -0,0 +1,93 @@
+import pygame
+
+from profiler import profiler
+from const import *
+
+# Scopes listed by the overlay, in the order they run in a frame.
+OVERLAY_SCOPES = ("events", "update", "collision", "animation", "draw", "scale", "flip")
+
+
+class PerformanceOverlay:
+    """
+    On-screen frame time breakdown with the rolling percentiles of every profiler scope.
+    Text is only rendered again every PROFILER_OVERLAY_REFRESH_FRAMES frames, so the overlay barely shows up in its own numbers.
+    """
+
+    def __init__(self):
+        self.visible = False
+        self.font = None
+        self.surface = None
+        self.frames_until_refresh = 0
+
+    def toggle(self):
+        """Show or hide the overlay, the profiler runs while it's visible."""
+        self.visible = not self.visible
+        profiler.enabled = self.visible or profiler.tracing
+        self.surface = None
+        self.frames_until_refresh = 0
+
+    def get_rows(self, camera_group):
+        """Helper function to get the text of the overlay as rows of cells, the cells are drawn in aligned columns."""
+        frame_percentiles = profiler.get_percentiles()
+        median_frame_time = frame_percentiles[PROFILER_PERCENTILES[0]]
+        fps = 1000 / median_frame_time if median_frame_time > 0 else 0.0
+        rows = [
+            (
+                f"{fps:.1f} fps",
+                f"drawn {camera_group.drawn_sprites}",
+                f"culled {camera_group.culled_sprites}",
+            ),
+            ("ms",) + tuple(f"p{percentile}" for percentile in PROFILER_PERCENTILES),
+        ]
+        for name in ("frame",) + OVERLAY_SCOPES:
+            percentiles = profiler.get_percentiles(None if name == "frame" else name)
+            rows.append(
+                (name,)
+                + tuple(
+                    f"{percentiles[percentile]:.2f}"
+                    for percentile in PROFILER_PERCENTILES
+                )
+            )
+        return rows
+
+    def render(self, camera_group):
+        """Helper function to render the text onto a translucent panel."""
+        # The font is only loaded once the overlay is first shown.
+        if self.font is None:
+            self.font = pygame.font.Font(None, PROFILER_OVERLAY_FONT_SIZE)
+        cell_surfaces = [
+            [self.font.render(cell, True, PROFILER_OVERLAY_COLOR) for cell in row]
+            for row in self.get_rows(camera_group)
+        ]
+        line_height = self.font.get_linesize()
+        padding = line_height // 2
+        column_widths = [0] * max(len(row) for row in cell_surfaces)
+        for row in cell_surfaces:
+            for column, surface in enumerate(row):
+                column_widths[column] = max(
+                    column_widths[column], surface.get_width() + padding
+                )
+
+        self.surface = pygame.Surface(
+            (
+                sum(column_widths) + padding,
+                line_height * len(cell_surfaces) + padding * 2,
+            ),
+            pygame.SRCALPHA,
+        )
+        self.surface.fill(PROFILER_OVERLAY_BACKGROUND_COLOR)
+        for row_index, row in enumerate(cell_surfaces):
+            x = padding
+            for column, surface in enumerate(row):
+                self.surface.blit(surface, (x, padding + row_index * line_height))
+                x += column_widths[column]
+
+    def draw(self, screen, camera_group):
+        """Draw the overlay in the top left corner of the screen, called after the camera draw."""
+        if not self.visible:
+            return
+        if self.frames_until_refresh <= 0:
+            self.render(camera_group)
+            self.frames_until_refresh = PROFILER_OVERLAY_REFRESH_FRAMES
+        self.frames_until_refresh -= 1
+        screen.blit(self.surface, (0, 0))
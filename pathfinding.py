@@ -0,0 +1,118 @@
+from collections import deque
+
+import pygame
+
+from const import *
+
+# Orthogonal steps only, a unit step always moves a rect by a whole pixel.
+NEIGHBOUR_STEPS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+
+class FlowField:
+    """
+    Grid flow field pointing every walkable tile towards the target tile (i.e. the player).
+    It's rebuilt with a single BFS only when the target moves to a new tile, and sampled by every enemy in O(1).
+    """
+
+    def __init__(self, width, height, blocked_rects=(), tile_size=TILE_SIZE):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.blocked = bytearray(width * height)
+        for rect in blocked_rects:
+            self.block_rect(rect)
+        self.distances = [-1] * (width * height)
+        self.directions = [(0, 0)] * (width * height)
+        self.target_tile = None
+
+        # Bumped on every rebuild so batched consumers know when to refresh their copies.
+        self.version = 0
+
+    @classmethod
+    def from_map_data(cls, map_data, tile_size=TILE_SIZE):
+        """Build a flow field from the trigger records of a map, so triggers which aren't loaded are impassable too."""
+        return cls(
+            map_data.width,
+            map_data.height,
+            [
+                pygame.Rect(x, y, width, height)
+                for name, x, y, width, height in map_data.triggers
+                if name in (HAZARD_TRIGGER, OBSTACLE_TRIGGER)
+            ],
+            tile_size,
+        )
+
+    def block_rect(self, rect):
+        """Mark every tile overlapped by a rect as impassable."""
+        left = max(int(rect.left // self.tile_size), 0)
+        top = max(int(rect.top // self.tile_size), 0)
+        right = min(int((rect.right - 1) // self.tile_size), self.width - 1)
+        bottom = min(int((rect.bottom - 1) // self.tile_size), self.height - 1)
+        for y in range(top, bottom + 1):
+            for x in range(left, right + 1):
+                self.blocked[y * self.width + x] = 1
+
+    def get_tile_index(self, pos):
+        """Get the flat index of the tile containing pos, or None when it's outside the map."""
+        x = int(pos[0] // self.tile_size)
+        y = int(pos[1] // self.tile_size)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return None
+
+    def update(self, target_pos):
+        """Rebuild the field if the target moved to another tile, returns True when it has been rebuilt."""
+        target_tile = self.get_tile_index(target_pos)
+        if target_tile is None or target_tile == self.target_tile:
+            return False
+        self.target_tile = target_tile
+
+        distances = [-1] * (self.width * self.height)
+        directions = [(0, 0)] * (self.width * self.height)
+        distances[target_tile] = 0
+        queue = deque((target_tile,))
+        while queue:
+            tile = queue.popleft()
+            x, y = tile % self.width, tile // self.width
+            for step_x, step_y in NEIGHBOUR_STEPS:
+                neighbour_x, neighbour_y = x + step_x, y + step_y
+                if not (
+                    0 <= neighbour_x < self.width and 0 <= neighbour_y < self.height
+                ):
+                    continue
+                neighbour = neighbour_y * self.width + neighbour_x
+                if distances[neighbour] != -1 or self.blocked[neighbour]:
+                    continue
+                distances[neighbour] = distances[tile] + 1
+
+                # Walking back along the BFS edge leads to the target.
+                directions[neighbour] = (-step_x, -step_y)
+                queue.append(neighbour)
+
+        self.distances = distances
+        self.directions = directions
+        self.version += 1
+        return True
+
+    def get_steering(self, pos, direction):
+        """
+        Get the direction to move from pos, given the straight direction to the target.
+        The straight direction is kept while the tile ahead is walkable and not further away,
+        otherwise the field direction is used. None means the field can't help (e.g. already on the target tile).
+        """
+        tile = self.get_tile_index(pos)
+        if tile is None or self.distances[tile] <= 0:
+            return None
+        ahead_tile = self.get_tile_index(
+            (
+                pos[0] + direction[0] * self.tile_size,
+                pos[1] + direction[1] * self.tile_size,
+            )
+        )
+        if (
+            ahead_tile is not None
+            and self.distances[ahead_tile] != -1
+            and self.distances[ahead_tile] <= self.distances[tile]
+        ):
+            return None
+        return self.directions[tile]
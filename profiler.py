@@ -0,0 +1,163 @@
+import json
+import os
+from collections import deque
+from time import perf_counter
+
+from const import *
+
+
+class ProfilerScope:
+    """Timing scope used as a context manager, it does nothing while the profiler is disabled."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        if self.profiler.enabled:
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profiler.enabled:
+            self.profiler.record(self.name, self.start, perf_counter())
+
+
+def get_percentile(sorted_values, percentile):
+    """Helper function to get a nearest rank percentile (0 to 100) of sorted values, 0.0 when there are none."""
+    if not sorted_values:
+        return 0.0
+    rank = round(percentile / 100 * (len(sorted_values) - 1))
+    return sorted_values[rank]
+
+
+class Profiler:
+    """
+    Accumulates the wall time spent in named scopes (e.g. events, update, collision, animation, draw, scale, flip).
+    Frames are delimited by next_frame(), the time of every scope in the last PROFILER_HISTORY_FRAMES frames is kept
+    for rolling percentiles. While tracing, every scope is also kept as an event for export_trace().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.scopes = {}
+        self.totals = {}
+        self.counts = {}
+
+        # Rolling history, per frame totals of every scope and the frame times themselves.
+        self.frame_start = None
+        self.frame_totals = {}
+        self.history = {}
+        self.frame_times = deque(maxlen=PROFILER_HISTORY_FRAMES)
+
+        # Trace events as (name, start, end) tuples, turned into the trace event format on export.
+        self.tracing = False
+        self.trace_start = perf_counter()
+        self.trace_events = []
+        self.dropped_trace_events = 0
+
+    def scope(self, name):
+        """Get the reusable timing scope of a name."""
+        scope = self.scopes.get(name)
+        if scope is None:
+            scope = ProfilerScope(self, name)
+            self.scopes[name] = scope
+        return scope
+
+    def record(self, name, start, end):
+        """Add a scope which ran from start to end (perf_counter seconds)."""
+        duration = end - start
+        self.totals[name] = self.totals.get(name, 0.0) + duration
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.frame_totals[name] = self.frame_totals.get(name, 0.0) + duration
+        if self.tracing:
+            if len(self.trace_events) < PROFILER_MAX_TRACE_EVENTS:
+                self.trace_events.append((name, start, end))
+            else:
+                self.dropped_trace_events += 1
+
+    def next_frame(self):
+        """Close the current frame and start the next one, called once at the start of every rendered frame."""
+        if not self.enabled:
+            self.frame_start = None
+            return
+        now = perf_counter()
+        if self.frame_start is not None:
+            self.frame_times.append(now - self.frame_start)
+            if self.tracing and len(self.trace_events) < PROFILER_MAX_TRACE_EVENTS:
+                self.trace_events.append(("frame", self.frame_start, now))
+
+            # Scopes which didn't run this frame count as 0, so the history of every scope covers the same frames.
+            for name in self.frame_totals.keys() | self.history.keys():
+                history = self.history.get(name)
+                if history is None:
+                    history = deque(maxlen=PROFILER_HISTORY_FRAMES)
+                    self.history[name] = history
+                history.append(self.frame_totals.get(name, 0.0))
+        self.frame_totals.clear()
+        self.frame_start = now
+
+    def get_percentiles(self, name=None, percentiles=PROFILER_PERCENTILES):
+        """Get the rolling percentiles in milliseconds of a scope's time per frame, or of the frame time without a name."""
+        history = self.frame_times if name is None else self.history.get(name, ())
+        sorted_values = sorted(history)
+        return {
+            percentile: get_percentile(sorted_values, percentile) * 1000
+            for percentile in percentiles
+        }
+
+    def start_tracing(self):
+        """Enable the profiler and start keeping trace events, dropping the previous ones."""
+        self.enabled = True
+        self.tracing = True
+        self.trace_start = perf_counter()
+        self.trace_events = []
+        self.dropped_trace_events = 0
+
+    def export_trace(self, trace_path):
+        """Write the trace events to a Chrome trace event file, which opens in chrome://tracing or Perfetto."""
+        pid = os.getpid()
+        trace_events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": 0,
+                "args": {"name": "main"},
+            }
+        ]
+        for name, start, end in self.trace_events:
+            trace_events.append(
+                {
+                    "name": name,
+                    "cat": "frame" if name == "frame" else "scope",
+                    "ph": "X",
+                    "ts": round((start - self.trace_start) * 1_000_000, 3),
+                    "dur": round((end - start) * 1_000_000, 3),
+                    "pid": pid,
+                    "tid": 0,
+                }
+            )
+        with open(trace_path, "w") as file:
+            json.dump(
+                {
+                    "traceEvents": trace_events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"dropped_events": self.dropped_trace_events},
+                },
+                file,
+            )
+
+    def reset(self):
+        self.totals.clear()
+        self.counts.clear()
+        self.frame_start = None
+        self.frame_totals.clear()
+        self.history.clear()
+        self.frame_times.clear()
+        self.trace_events = []
+        self.dropped_trace_events = 0
+
+
+profiler = Profiler()
@@ -0,0 +1,269 @@
+import itertools
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import pygame
+
+from audio import sound_bank
+from const import *
+
+# Owners of a projectile, enemy projectiles hurt the player and reflected ones hurt enemies.
+ENEMY_OWNER = 0
+PLAYER_OWNER = 1
+
+
+class ProjectileSystem:
+    """
+    Pooled projectiles for the bullet-hell attacks, requires numpy.
+    Projectiles aren't sprites, their position, velocity, lifetime and owner live in preallocated arrays of PROJECTILE_CAPACITY slots.
+    Every tick moves them, expires them (lifetime, leaving the map, hitting an obstacle) and checks them against the
+    player and enemy rects in a few batched passes. The player's sword reflects enemy projectiles back at the enemies.
+    """
+
+    def __init__(
+        self,
+        group,
+        player_sprite,
+        width,
+        height,
+        obstacle_rects=(),
+        capacity=PROJECTILE_CAPACITY,
+    ):
+        if np is None:
+            raise ImportError("ProjectileSystem requires numpy to be installed.")
+        self.group = group
+        self.player_sprite = player_sprite
+        self.capacity = capacity
+        self.positions = np.zeros((capacity, 2))
+        self.previous_positions = np.zeros((capacity, 2))
+        self.velocities = np.zeros((capacity, 2))
+        self.lifetimes = np.zeros(capacity, dtype=np.int32)
+        self.owners = np.zeros(capacity, dtype=np.int8)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.active_count = 0
+        self.dropped = 0
+
+        # Obstacle tiles, projectiles fly over hazards (e.g. water) but not through obstacles.
+        self.width = width
+        self.height = height
+        self.obstacles = np.zeros((height, width), dtype=bool)
+        for rect in obstacle_rects:
+            self.obstacles[
+                max(rect.top // TILE_SIZE, 0) : (rect.bottom - 1) // TILE_SIZE + 1,
+                max(rect.left // TILE_SIZE, 0) : (rect.right - 1) // TILE_SIZE + 1,
+            ] = True
+
+        # Every projectile of an owner shares a single image.
+        self.images = {
+            ENEMY_OWNER: self.create_image(PROJECTILE_ENEMY_COLOR),
+            PLAYER_OWNER: self.create_image(PROJECTILE_PLAYER_COLOR),
+        }
+
+    @classmethod
+    def from_map_data(
+        cls, map_data, group, player_sprite, capacity=PROJECTILE_CAPACITY
+    ):
+        """Build a projectile system from the trigger records of a map, so obstacles which aren't loaded still stop projectiles."""
+        return cls(
+            group,
+            player_sprite,
+            map_data.width,
+            map_data.height,
+            [
+                pygame.Rect(x, y, width, height)
+                for name, x, y, width, height in map_data.triggers
+                if name == OBSTACLE_TRIGGER
+            ],
+            capacity,
+        )
+
+    def __len__(self):
+        return self.active_count
+
+    def create_image(self, color):
+        """Helper function to draw the shared image of a projectile."""
+        image = pygame.Surface(
+            (PROJECTILE_RADIUS * 2, PROJECTILE_RADIUS * 2), pygame.SRCALPHA
+        )
+        pygame.draw.circle(
+            image, color, (PROJECTILE_RADIUS, PROJECTILE_RADIUS), PROJECTILE_RADIUS
+        )
+        return image
+
+    def spawn(
+        self, positions, velocities, owner=ENEMY_OWNER, lifetime=PROJECTILE_LIFETIME
+    ):
+        """
+        Spawn projectiles in free slots, positions and velocities are (count, 2) array-likes in pixels and pixels per tick.
+        Projectiles which don't fit in the pool are dropped, returns how many were spawned.
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        velocities = np.asarray(velocities, dtype=float).reshape(-1, 2)
+        slots = np.flatnonzero(~self.active)[: len(positions)]
+        self.dropped += len(positions) - len(slots)
+        count = len(slots)
+        self.positions[slots] = positions[:count]
+        self.previous_positions[slots] = positions[:count]
+        self.velocities[slots] = velocities[:count]
+        self.lifetimes[slots] = lifetime
+        self.owners[slots] = owner
+        self.active[slots] = True
+        self.active_count += count
+        return count
+
+    def spawn_ring(
+        self, center, count, speed=PROJECTILE_SPEED, angle=0.0, owner=ENEMY_OWNER
+    ):
+        """Spawn count projectiles flying out of center in a ring, the first one at angle (radians)."""
+        angles = angle + np.arange(count) * (2 * np.pi / count)
+        directions = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+        return self.spawn(
+            np.broadcast_to(center, (count, 2)), directions * speed, owner
+        )
+
+    def expire(self, slots):
+        """Helper function to free the slots of projectiles."""
+        self.active[slots] = False
+        self.active_count -= len(slots)
+
+    def handle_movement(self, slots):
+        """Move the projectiles and expire the ones out of lifetime, off the map or in an obstacle, returns the remaining slots."""
+        # Moving the whole pool is cheaper than gathering the active slots, free slots are never read.
+        np.copyto(self.previous_positions, self.positions)
+        self.positions += self.velocities
+        self.lifetimes -= 1
+
+        positions = self.positions[slots]
+        tiles = (positions * (1 / TILE_SIZE)).astype(np.int32)
+        inside = (
+            (positions[:, 0] >= 0)
+            & (positions[:, 1] >= 0)
+            & (tiles[:, 0] < self.width)
+            & (tiles[:, 1] < self.height)
+        )
+        expired = (self.lifetimes[slots] <= 0) | ~inside
+        expired[inside] |= self.obstacles[tiles[inside, 1], tiles[inside, 0]]
+        self.expire(slots[expired])
+        return slots[~expired]
+
+    def get_rect_hits(self, slots, rects):
+        """Helper function to get, for each projectile, the index of the first (left, top, right, bottom) rect it's in, or -1."""
+        positions = self.positions[slots]
+        x = positions[:, 0, np.newaxis]
+        y = positions[:, 1, np.newaxis]
+        inside = (
+            (x >= rects[:, 0] - PROJECTILE_RADIUS)
+            & (x < rects[:, 2] + PROJECTILE_RADIUS)
+            & (y >= rects[:, 1] - PROJECTILE_RADIUS)
+            & (y < rects[:, 3] + PROJECTILE_RADIUS)
+        )
+        return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+    def handle_player_collision(self, slots):
+        """Reflect the enemy projectiles hitting the swinging player, or hurt the player with them unless it's invisible."""
+        player_sprite = self.player_sprite
+        if not player_sprite.alive() or player_sprite.dying:
+            return
+        slots = slots[self.owners[slots] == ENEMY_OWNER]
+        rect = player_sprite.rect
+        player_rects = np.array([[rect.left, rect.top, rect.right, rect.bottom]])
+        hits = slots[self.get_rect_hits(slots, player_rects) == 0]
+        if len(hits) == 0:
+            return
+
+        if player_sprite.attacking:
+            # Reflected away from the player's center, faster than they came.
+            away = self.positions[hits] - np.array(rect.center, dtype=float)
+            lengths = np.linalg.norm(away, axis=1)[:, np.newaxis]
+            speeds = np.linalg.norm(self.velocities[hits], axis=1)[:, np.newaxis]
+            # Projectiles right on the center bounce straight back instead.
+            directions = np.divide(
+                away,
+                lengths,
+                out=-self.velocities[hits] / np.maximum(speeds, 1e-9),
+                where=lengths != 0,
+            )
+            self.velocities[hits] = directions * speeds * PROJECTILE_REFLECT_SPEED_SCALE
+            self.owners[hits] = PLAYER_OWNER
+            self.lifetimes[hits] = PROJECTILE_LIFETIME
+            sound_bank.play(ENEMY_HIT_SOUND)
+        elif player_sprite.invisibility_countdown == 0:
+            # A single projectile hurts, the player is invisible to the rest afterwards.
+            self.expire(hits[:1])
+            player_sprite.health -= PROJECTILE_DAMAGE
+            player_sprite.invisibility_countdown = PLAYER_INVISIBILITY_FRAMES
+            sound_bank.play(PLAYER_DAMAGE_SOUND)
+
+    def handle_enemy_collision(self, slots):
+        """Hurt the enemies hit by reflected projectiles, every projectile hits a single enemy and is used up."""
+        slots = slots[self.owners[slots] == PLAYER_OWNER]
+        if len(slots) == 0:
+            return
+        enemies = [
+            sprite
+            for sprite in self.group
+            if hasattr(sprite, "enemy_name") and not sprite.dying
+        ]
+        if not enemies:
+            return
+        rects = np.array(
+            [
+                (enemy.rect.left, enemy.rect.top, enemy.rect.right, enemy.rect.bottom)
+                for enemy in enemies
+            ]
+        )
+        hits = self.get_rect_hits(slots, rects)
+        hit = hits >= 0
+        self.expire(slots[hit])
+        for enemy_index in hits[hit].tolist():
+            enemy = enemies[enemy_index]
+            enemy.health -= PROJECTILE_DAMAGE
+            enemy.hit_countdown = ENEMY_FLASH_FRAMES
+            sound_bank.play(ENEMY_DAMAGE_SOUND)
+
+    def update(self):
+        """Run a tick of every projectile, called after the group update so the player's attack state is current."""
+        if self.active_count == 0:
+            return
+        slots = np.flatnonzero(self.active)
+        slots = self.handle_movement(slots)
+        self.handle_player_collision(slots)
+        self.handle_enemy_collision(slots[self.active[slots]])
+
+    def draw(self, surface, offset, visible_rect, interpolation=1.0):
+        """Draw the projectiles overlapping visible_rect in one batched blit per owner, interpolated between the last two ticks."""
+        if self.active_count == 0:
+            return
+        slots = np.flatnonzero(self.active)
+        positions = self.positions[slots]
+        if interpolation < 1:
+            previous_positions = self.previous_positions[slots]
+            positions = (
+                previous_positions + (positions - previous_positions) * interpolation
+            )
+        visible = (
+            (positions[:, 0] >= visible_rect.left - PROJECTILE_RADIUS)
+            & (positions[:, 0] < visible_rect.right + PROJECTILE_RADIUS)
+            & (positions[:, 1] >= visible_rect.top - PROJECTILE_RADIUS)
+            & (positions[:, 1] < visible_rect.bottom + PROJECTILE_RADIUS)
+        )
+        owners = self.owners[slots[visible]]
+        draw_positions = np.rint(
+            positions[visible]
+            - (offset.x + PROJECTILE_RADIUS, offset.y + PROJECTILE_RADIUS)
+        ).astype(np.int32)
+
+        for owner, image in self.images.items():
+            image_positions = draw_positions[owners == owner].tolist()
+            if not image_positions:
+                continue
+            blit_sequence = zip(itertools.repeat(image), image_positions)
+
+            # pygame-ce's fblits skips the per blit bookkeeping of blits.
+            if hasattr(surface, "fblits"):
+                surface.fblits(blit_sequence)
+            else:
+                surface.blits(blit_sequence, doreturn=False)
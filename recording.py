@@ -0,0 +1,161 @@
+"""
+Input recording and deterministic replay, e.g.
+python main.py --record session.dbinput
+DUNGEON_BREAKOUT_HEADLESS=1 python main.py --replay session.dbinput --trace trace.json
+
+Layout of a recording, little-endian:
+    header      magic, version, flags (enemy system, streaming, activity scheduler, projectiles, crowd separation)
+                and tick count
+    map         length prefixed path of the TMX map
+    runs        (input bits, tick count) records, consecutive ticks with the same input share a run
+"""
+
+import struct
+
+from controls import Controls, InputState
+from const import *
+
+MAGIC = b"DBIR"
+HEADER_STRUCT = struct.Struct("<4sHBI")
+LENGTH_STRUCT = struct.Struct("<H")
+RUN_STRUCT = struct.Struct("<BH")
+MAX_RUN_TICKS = 0xFFFF
+
+# Flag bits of the game settings which change the simulation.
+ENEMY_SYSTEM_FLAG = 1
+STREAMING_FLAG = 2
+ACTIVITY_SCHEDULER_FLAG = 4
+PROJECTILES_FLAG = 8
+CROWD_SEPARATION_FLAG = 16
+
+
+class InputRecording:
+    """
+    Input of every simulation tick of a session as packed InputState bits, with the map and settings it was played with.
+    The simulation only depends on the per tick input, so replaying it with the same settings gives the same session.
+    """
+
+    def __init__(
+        self,
+        tmx_path,
+        use_enemy_system=USE_ENEMY_SYSTEM,
+        streaming=USE_STREAMING,
+        use_activity_scheduler=USE_ACTIVITY_SCHEDULER,
+        use_projectiles=USE_PROJECTILES,
+        use_crowd_separation=USE_CROWD_SEPARATION,
+        ticks=None,
+    ):
+        self.tmx_path = tmx_path
+        self.use_enemy_system = use_enemy_system
+        self.streaming = streaming
+        self.use_activity_scheduler = use_activity_scheduler
+        self.use_projectiles = use_projectiles
+        self.use_crowd_separation = use_crowd_separation
+        self.ticks = ticks if ticks is not None else bytearray()
+
+    def __len__(self):
+        return len(self.ticks)
+
+
+def write_input_recording(recording, recording_path):
+    """Write a recording to a file, run length encoding the ticks."""
+    flags = (
+        (ENEMY_SYSTEM_FLAG if recording.use_enemy_system else 0)
+        | (STREAMING_FLAG if recording.streaming else 0)
+        | (ACTIVITY_SCHEDULER_FLAG if recording.use_activity_scheduler else 0)
+        | (PROJECTILES_FLAG if recording.use_projectiles else 0)
+        | (CROWD_SEPARATION_FLAG if recording.use_crowd_separation else 0)
+    )
+    tmx_path = recording.tmx_path.encode()
+    parts = [
+        HEADER_STRUCT.pack(MAGIC, INPUT_RECORDING_VERSION, flags, len(recording)),
+        LENGTH_STRUCT.pack(len(tmx_path)),
+        tmx_path,
+    ]
+
+    # Runs are split when they'd overflow their tick count.
+    run_bits = None
+    run_ticks = 0
+    for bits in recording.ticks:
+        if bits == run_bits and run_ticks < MAX_RUN_TICKS:
+            run_ticks += 1
+            continue
+        if run_ticks > 0:
+            parts.append(RUN_STRUCT.pack(run_bits, run_ticks))
+        run_bits = bits
+        run_ticks = 1
+    if run_ticks > 0:
+        parts.append(RUN_STRUCT.pack(run_bits, run_ticks))
+
+    with open(recording_path, "wb") as file:
+        file.write(b"".join(parts))
+
+
+def read_input_recording(recording_path):
+    """Read a recording written by write_input_recording(), raises a ValueError if the file isn't a valid recording."""
+    with open(recording_path, "rb") as file:
+        buffer = file.read()
+    try:
+        magic, version, flags, tick_count = HEADER_STRUCT.unpack_from(buffer, 0)
+        offset = HEADER_STRUCT.size
+        (length,) = LENGTH_STRUCT.unpack_from(buffer, offset)
+        offset += LENGTH_STRUCT.size
+        tmx_path = buffer[offset : offset + length].decode()
+        offset += length
+        runs = list(RUN_STRUCT.iter_unpack(buffer[offset:]))
+    except (struct.error, UnicodeDecodeError):
+        raise ValueError(f"{recording_path} is not an input recording.")
+    if magic != MAGIC or version != INPUT_RECORDING_VERSION:
+        raise ValueError(f"{recording_path} is not an input recording.")
+
+    ticks = bytearray()
+    for bits, run_ticks in runs:
+        ticks.extend(bytes((bits,)) * run_ticks)
+    if len(ticks) != tick_count:
+        raise ValueError(f"{recording_path} is truncated.")
+
+    return InputRecording(
+        tmx_path,
+        bool(flags & ENEMY_SYSTEM_FLAG),
+        bool(flags & STREAMING_FLAG),
+        bool(flags & ACTIVITY_SCHEDULER_FLAG),
+        bool(flags & PROJECTILES_FLAG),
+        bool(flags & CROWD_SEPARATION_FLAG),
+        ticks,
+    )
+
+
+class RecordingControls(Controls):
+    """Wraps another input source and records the input of every tick it polls."""
+
+    def __init__(self, controls, recording):
+        super().__init__()
+        self.controls = controls
+        self.recording = recording
+
+    def handle_event(self, event):
+        self.controls.handle_event(event)
+
+    def poll(self):
+        self.state = self.controls.poll()
+        self.finished = self.controls.finished
+        self.recording.ticks.append(self.state.to_bits())
+        return self.state
+
+
+class ReplayControls(Controls):
+    """Input of a recording tick by tick, finished once every recorded tick has been polled."""
+
+    def __init__(self, recording):
+        super().__init__()
+        self.recording = recording
+        self.tick = 0
+
+    def poll(self):
+        if self.tick < len(self.recording):
+            self.state = InputState.from_bits(self.recording.ticks[self.tick])
+            self.tick += 1
+        else:
+            self.state = InputState()
+        self.finished = self.tick >= len(self.recording)
+        return self.state
@@ -0,0 +1,107 @@
+import pygame
+
+from const import *
+
+
+class SpatialHash:
+    """
+    Uniform grid which buckets items by the cells their rect overlaps, so rect queries only look at nearby items.
+    Query results keep the order in which the items were first inserted.
+    """
+
+    def __init__(self, cell_size=SPATIAL_HASH_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.item_rects = {}
+        self.item_cell_ranges = {}
+        self.item_orders = {}
+        self.order_counter = 0
+
+    def __len__(self):
+        return len(self.item_rects)
+
+    def __contains__(self, item):
+        return item in self.item_rects
+
+    def __iter__(self):
+        return iter(self.item_rects)
+
+    def get_cell_range(self, rect):
+        """Get the inclusive (left, top, right, bottom) cell coordinates overlapped by a rect."""
+        return (
+            rect.left // self.cell_size,
+            rect.top // self.cell_size,
+            (rect.left + max(rect.width, 1) - 1) // self.cell_size,
+            (rect.top + max(rect.height, 1) - 1) // self.cell_size,
+        )
+
+    def add_to_cells(self, item, cell_range):
+        """Helper function to add an item into every cell of a cell range."""
+        left, top, right, bottom = cell_range
+        for cell_y in range(top, bottom + 1):
+            for cell_x in range(left, right + 1):
+                self.cells.setdefault((cell_x, cell_y), {})[item] = None
+
+    def remove_from_cells(self, item, cell_range):
+        """Helper function to remove an item from every cell of a cell range."""
+        left, top, right, bottom = cell_range
+        for cell_y in range(top, bottom + 1):
+            for cell_x in range(left, right + 1):
+                cell = self.cells[(cell_x, cell_y)]
+                del cell[item]
+                if not cell:
+                    del self.cells[(cell_x, cell_y)]
+
+    def insert(self, item, rect):
+        """Insert an item, or move it if it has already been inserted."""
+        if item in self.item_rects:
+            self.move(item, rect)
+            return
+        cell_range = self.get_cell_range(rect)
+        self.add_to_cells(item, cell_range)
+        self.item_rects[item] = pygame.Rect(rect)
+        self.item_cell_ranges[item] = cell_range
+        self.item_orders[item] = self.order_counter
+        self.order_counter += 1
+
+    def move(self, item, rect):
+        """Update the rect of an item, the cells are only touched when the cell range changes."""
+        if item not in self.item_rects:
+            self.insert(item, rect)
+            return
+        self.item_rects[item].update(rect)
+        cell_range = self.get_cell_range(rect)
+        if cell_range != self.item_cell_ranges[item]:
+            self.remove_from_cells(item, self.item_cell_ranges[item])
+            self.add_to_cells(item, cell_range)
+            self.item_cell_ranges[item] = cell_range
+
+    def remove(self, item):
+        """Remove an item, removing an item which isn't inserted is a no-op."""
+        if item not in self.item_rects:
+            return
+        self.remove_from_cells(item, self.item_cell_ranges.pop(item))
+        del self.item_rects[item]
+        del self.item_orders[item]
+
+    def clear(self):
+        """Remove every item."""
+        self.cells.clear()
+        self.item_rects.clear()
+        self.item_cell_ranges.clear()
+        self.item_orders.clear()
+
+    def query(self, rect):
+        """Get every item whose rect collides with the given rect, in insertion order."""
+        rect = pygame.Rect(rect)
+        left, top, right, bottom = self.get_cell_range(rect)
+        found = {}
+        for cell_y in range(top, bottom + 1):
+            for cell_x in range(left, right + 1):
+                cell = self.cells.get((cell_x, cell_y))
+                if cell:
+                    found.update(cell)
+        return sorted(
+            (item for item in found if rect.colliderect(self.item_rects[item])),
+            key=self.item_orders.__getitem__,
+        )
@@ -0,0 +1,207 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from mapcache import read_chunk_bytes
+from assets import registry
+from const import *
+
+
+class WorldStreamer:
+    """
+    Keeps only the chunks around the player resident, i.e. their tiles, triggers and enemies.
+    Tile pixels are read from the map cache on a background thread and turned into surfaces on the main thread.
+    Triggers spanning several chunks are reference counted, enemies in unloaded chunks are kept as dormant records.
+    """
+
+    def __init__(self, game, map_data):
+        self.game = game
+        self.map_data = map_data
+        self.static_layer = map_data.static_layer
+        self.chunk_size = self.static_layer.chunk_size
+        self.columns = math.ceil(map_data.width * TILE_SIZE / self.chunk_size)
+        self.rows = math.ceil(map_data.height * TILE_SIZE / self.chunk_size)
+
+        # Chunks within the largest view (i.e. at the minimum zoom) plus a margin are resident.
+        self.radius_x = math.ceil(SCREEN_WIDTH / MIN_ZOOM_SCALE / 2 / self.chunk_size)
+        self.radius_y = math.ceil(SCREEN_HEIGHT / MIN_ZOOM_SCALE / 2 / self.chunk_size)
+        self.center_chunk = None
+        self.resident_chunks = set()
+
+        # Tiles are only streamed from a map cache, without one they're all resident already.
+        self.executor = (
+            ThreadPoolExecutor(STREAMING_IO_WORKERS)
+            if map_data.cache_path is not None
+            else None
+        )
+        self.pending_chunks = {}
+
+        # Trigger indices by chunk, the live trigger sprites and how many resident chunks reference them.
+        self.chunk_triggers = {}
+        for trigger_index, (_, x, y, width, height) in enumerate(map_data.triggers):
+            columns, rows = self.static_layer.get_chunk_range(
+                pygame.Rect(x, y, width, height)
+            )
+            for chunk_y in rows:
+                for chunk_x in columns:
+                    self.chunk_triggers.setdefault((chunk_x, chunk_y), []).append(
+                        trigger_index
+                    )
+        self.triggers = {}
+        self.trigger_references = {}
+
+        # Dormant enemies by chunk as (name, pos, health) records, and the live ones spawned from them.
+        self.dormant_enemies = {}
+        self.live_enemies = []
+        registry.preload_enemies({name for name, _, _ in map_data.enemies})
+        for name, x, y in map_data.enemies:
+            self.add_enemy(name, (x, y))
+
+    def get_chunk_pos(self, pos):
+        """Get the chunk containing pos, positions outside the map are clamped into it."""
+        return (
+            min(max(int(pos[0] // self.chunk_size), 0), self.columns - 1),
+            min(max(int(pos[1] // self.chunk_size), 0), self.rows - 1),
+        )
+
+    def get_chunks_around(self, center_chunk, margin):
+        """Get the chunks within the largest view of center_chunk, grown by margin chunks and clamped to the map."""
+        center_x, center_y = center_chunk
+        return {
+            (chunk_x, chunk_y)
+            for chunk_y in range(
+                max(center_y - self.radius_y - margin, 0),
+                min(center_y + self.radius_y + margin, self.rows - 1) + 1,
+            )
+            for chunk_x in range(
+                max(center_x - self.radius_x - margin, 0),
+                min(center_x + self.radius_x + margin, self.columns - 1) + 1,
+            )
+        }
+
+    def add_enemy(self, enemy_name, pos, health=MAX_ENEMY_HEALTH):
+        """Add an enemy to the world, it's spawned right away if its chunk is resident, otherwise it's dormant."""
+        chunk_pos = self.get_chunk_pos(pos)
+        if chunk_pos in self.resident_chunks:
+            self.spawn_enemy(enemy_name, pos, health)
+        else:
+            self.dormant_enemies.setdefault(chunk_pos, []).append(
+                (enemy_name, pos, health)
+            )
+
+    def spawn_enemy(self, enemy_name, pos, health):
+        """Helper function to turn an enemy record into a live enemy."""
+        enemy = self.game.spawn_enemy(
+            enemy_name,
+            pos,
+            self.game.player_sprite,
+            self.game.camera_group,
+            self.game.enemy_system,
+        )
+        enemy.health = health
+        self.live_enemies.append(enemy)
+
+    def despawn_enemies(self):
+        """Helper function to turn the live enemies outside the resident chunks back into dormant records."""
+        live_enemies = []
+        for enemy in self.live_enemies:
+            if not enemy.alive():
+                continue
+            chunk_pos = self.get_chunk_pos(enemy.rect.center)
+            if chunk_pos in self.resident_chunks:
+                live_enemies.append(enemy)
+                continue
+            self.dormant_enemies.setdefault(chunk_pos, []).append(
+                (enemy.enemy_name, enemy.rect.center, enemy.health)
+            )
+            enemy.kill()
+        self.live_enemies = live_enemies
+
+    def load_chunk(self, chunk_pos):
+        """Make a chunk resident, its tiles arrive later from the background thread."""
+        self.resident_chunks.add(chunk_pos)
+        if self.executor is not None and chunk_pos in self.map_data.chunk_offsets:
+            self.pending_chunks[chunk_pos] = self.executor.submit(
+                read_chunk_bytes,
+                self.map_data.cache_path,
+                self.map_data.chunk_offsets[chunk_pos],
+                self.chunk_size,
+            )
+
+        for trigger_index in self.chunk_triggers.get(chunk_pos, ()):
+            references = self.trigger_references.get(trigger_index, 0)
+            if references == 0:
+                name, x, y, width, height = self.map_data.triggers[trigger_index]
+                self.triggers[trigger_index] = self.game.spawn_trigger(
+                    name, (x, y), width, height, self.game.camera_group
+                )
+            self.trigger_references[trigger_index] = references + 1
+
+        for enemy_name, pos, health in self.dormant_enemies.pop(chunk_pos, ()):
+            self.spawn_enemy(enemy_name, pos, health)
+
+    def unload_chunk(self, chunk_pos):
+        """Drop a chunk's tiles and the triggers no other resident chunk references."""
+        self.resident_chunks.discard(chunk_pos)
+        if self.executor is not None:
+            future = self.pending_chunks.pop(chunk_pos, None)
+            if future is not None:
+                future.cancel()
+            self.static_layer.unload_chunk(chunk_pos)
+
+        for trigger_index in self.chunk_triggers.get(chunk_pos, ()):
+            self.trigger_references[trigger_index] -= 1
+            if self.trigger_references[trigger_index] > 0:
+                continue
+            del self.trigger_references[trigger_index]
+            trigger = self.triggers.pop(trigger_index)
+            if trigger is not None:
+                self.game.camera_group.trigger_index.remove(trigger)
+                trigger.kill()
+
+    def finish_pending_chunks(self, wait=False):
+        """Helper function to turn the chunk pixels read so far into surfaces, or all of them when waiting."""
+        for chunk_pos, future in list(self.pending_chunks.items()):
+            if wait or future.done():
+                del self.pending_chunks[chunk_pos]
+                self.static_layer.load_chunk(chunk_pos, future.result())
+
+    def update(self, center, wait=False):
+        """Stream chunks in and out around center (e.g. the player), called once per tick."""
+        center_chunk = self.get_chunk_pos(center)
+        if center_chunk != self.center_chunk:
+            self.center_chunk = center_chunk
+
+            # Chunks are unloaded further away than they're loaded, so walking along a border doesn't thrash.
+            for chunk_pos in sorted(
+                self.get_chunks_around(center_chunk, STREAMING_LOAD_MARGIN)
+                - self.resident_chunks
+            ):
+                self.load_chunk(chunk_pos)
+            for chunk_pos in sorted(
+                self.resident_chunks
+                - self.get_chunks_around(center_chunk, STREAMING_UNLOAD_MARGIN)
+            ):
+                self.unload_chunk(chunk_pos)
+            self.despawn_enemies()
+        self.finish_pending_chunks(wait)
+
+    def get_stats(self):
+        """Get the number of resident chunks, loaded tile chunks, live triggers, and live and dormant enemies."""
+        return {
+            "resident_chunks": len(self.resident_chunks),
+            "tile_chunks": len(self.static_layer.chunks),
+            "triggers": sum(
+                1 for trigger in self.triggers.values() if trigger is not None
+            ),
+            "live_enemies": sum(1 for enemy in self.live_enemies if enemy.alive()),
+            "dormant_enemies": sum(
+                len(records) for records in self.dormant_enemies.values()
+            ),
+        }
+
+    def close(self):
+        """Stop the background thread, pending reads are dropped."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
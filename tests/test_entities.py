@@ -0,0 +1,34 @@
+from entities import EntityStore, StoreField
+
+from const import *
+
+
+class StoredEntity:
+    """Minimal entity with its health in an entity store, like sprites.Entity."""
+
+    health = StoreField("health")
+
+    def __init__(self, entity_store, health):
+        self.entity_store = entity_store
+        self.entity_row = entity_store.allocate()
+        self.health = health
+
+
+def test_fractional_health():
+    entity = StoredEntity(EntityStore(), 3.5)
+    assert entity.health == 3.5
+
+
+def test_fractional_damage():
+    entity = StoredEntity(EntityStore(), MAX_ENEMY_HEALTH)
+    entity.health -= 0.5
+    assert entity.health == MAX_ENEMY_HEALTH - 0.5
+
+
+def test_detach_keeps_fractional_health():
+    entity_store = EntityStore()
+    entity = StoredEntity(entity_store, 2.25)
+    entity.entity_store = entity_store.detach(entity.entity_row)
+    entity.entity_row = 0
+    assert entity.health == 2.25
+    assert len(entity_store) == 0
@@ -0,0 +1,24 @@
+from recording import InputRecording, read_input_recording, write_input_recording
+
+
+def test_settings_round_trip(tmp_path):
+    recording = InputRecording(
+        "maps/tmx/open_island.tmx",
+        use_enemy_system=True,
+        streaming=False,
+        use_activity_scheduler=False,
+        use_projectiles=True,
+        use_crowd_separation=False,
+        ticks=bytearray([0, 0, 3, 64]),
+    )
+    recording_path = tmp_path / "session.dbinput"
+    write_input_recording(recording, recording_path)
+
+    replayed = read_input_recording(recording_path)
+    assert replayed.tmx_path == recording.tmx_path
+    assert replayed.use_enemy_system
+    assert not replayed.streaming
+    assert not replayed.use_activity_scheduler
+    assert replayed.use_projectiles
+    assert not replayed.use_crowd_separation
+    assert replayed.ticks == recording.ticks
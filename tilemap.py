@@ -0,0 +1,89 @@
+import pygame
+
+from const import *
+
+
+class StaticLayer:
+    """
+    Static tile layer which bakes every tile into fixed-size chunk surfaces at load time.
+    Only the chunks overlapping the camera are blitted, instead of one sprite per map cell.
+    """
+
+    def __init__(self, chunk_size=TILES_PER_CHUNK * TILE_SIZE):
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.drawn_chunks = 0
+
+    @classmethod
+    def from_tmx(cls, tmx_data, chunk_size=TILES_PER_CHUNK * TILE_SIZE):
+        """Bake all tile layers of a pytmx map, in layer order."""
+        static_layer = cls(chunk_size)
+        for layer in tmx_data.layers:
+            if hasattr(layer, "data"):
+                for x, y, image in layer.tiles():
+                    static_layer.bake_tile((x * TILE_SIZE, y * TILE_SIZE), image)
+        return static_layer
+
+    def get_chunk_range(self, rect):
+        """Get the range of chunk coordinates overlapped by a rect in world space."""
+        left = rect.left // self.chunk_size
+        top = rect.top // self.chunk_size
+        right = (rect.right - 1) // self.chunk_size
+        bottom = (rect.bottom - 1) // self.chunk_size
+        return range(left, right + 1), range(top, bottom + 1)
+
+    def get_chunk(self, chunk_pos):
+        """Get the chunk surface at the chunk coordinate, creating an empty one if needed."""
+        chunk = self.chunks.get(chunk_pos)
+        if chunk is None:
+            chunk = pygame.Surface(
+                (self.chunk_size, self.chunk_size), pygame.SRCALPHA
+            ).convert_alpha()
+            self.chunks[chunk_pos] = chunk
+        return chunk
+
+    def get_chunk_bytes(self, chunk_pos):
+        """Get the RGBA pixels of a chunk, used to compile the map cache."""
+        return pygame.image.tobytes(self.chunks[chunk_pos], "RGBA")
+
+    def load_chunk(self, chunk_pos, data):
+        """Set a chunk from its RGBA pixels (e.g. a slice of the map cache), the pixels are copied."""
+        self.chunks[chunk_pos] = pygame.image.frombuffer(
+            data, (self.chunk_size, self.chunk_size), "RGBA"
+        ).convert_alpha()
+
+    def unload_chunk(self, chunk_pos):
+        """Drop a chunk surface, does nothing if it isn't loaded."""
+        self.chunks.pop(chunk_pos, None)
+
+    def bake_tile(self, pos, image):
+        """Blit a tile into every chunk it overlaps, tiles larger than TILE_SIZE may span chunks."""
+        tile_rect = image.get_rect(topleft=pos)
+        columns, rows = self.get_chunk_range(tile_rect)
+        for chunk_y in rows:
+            for chunk_x in columns:
+                self.get_chunk((chunk_x, chunk_y)).blit(
+                    image,
+                    (
+                        tile_rect.x - chunk_x * self.chunk_size,
+                        tile_rect.y - chunk_y * self.chunk_size,
+                    ),
+                )
+
+    def draw(self, surface, visible_rect, offset):
+        """Blit the chunks overlapping visible_rect (in world space), shifted by the camera offset."""
+        self.drawn_chunks = 0
+        columns, rows = self.get_chunk_range(visible_rect)
+        for chunk_y in rows:
+            for chunk_x in columns:
+                chunk = self.chunks.get((chunk_x, chunk_y))
+                if chunk is None:
+                    continue
+                surface.blit(
+                    chunk,
+                    (
+                        chunk_x * self.chunk_size - offset[0],
+                        chunk_y * self.chunk_size - offset[1],
+                    ),
+                )
+                self.drawn_chunks += 1
@@ -47,14 +47,46 @@ def split_spritesheets(
         sprite_rect = pygame.Rect(i * width, 0, width, height)
         sprite_surface.blit(spritesheet_surface, (0, 0), sprite_rect)
         sprites.append(pygame.transform.scale_by(sprite_surface, scale_factor))
-        if flipped:
-            spritesheets[f"{spritesheet_name.replace('.png', '')}_right"] = sprites
-            spritesheets[f"{spritesheet_name.replace('.png', '')}_left"] = flip(sprites)
-        else:
-            spritesheets[spritesheet_name.replace(".png", "")] = sprites
+    if flipped:
+        spritesheets[f"{spritesheet_name.replace('.png', '')}_right"] = sprites
+        spritesheets[f"{spritesheet_name.replace('.png', '')}_left"] = flip(sprites)
+    else:
+        spritesheets[spritesheet_name.replace(".png", "")] = sprites
     return spritesheets
 
 
+def create_masks(spritesheets):
+    """Create a mask for every frame in the spritesheets, keyed and ordered the same way as the frames."""
+    masks = {}
+    for name, sprites in spritesheets.items():
+        masks[name] = [pygame.mask.from_surface(sprite) for sprite in sprites]
+    return masks
+
+
+def create_alpha_variants(spritesheets, alpha):
+    """Create a copy of every frame with its alpha multiplied by alpha / 255, keyed the same way as the frames."""
+    variants = {}
+    for name, sprites in spritesheets.items():
+        variants[name] = []
+        for sprite in sprites:
+            variant = sprite.copy()
+            variant.fill((255, 255, 255, alpha), special_flags=pygame.BLEND_RGBA_MULT)
+            variants[name].append(variant)
+    return variants
+
+
+def create_tint_variants(spritesheets, color):
+    """Create a copy of every frame with color added to it, keyed the same way as the frames."""
+    variants = {}
+    for name, sprites in spritesheets.items():
+        variants[name] = []
+        for sprite in sprites:
+            variant = sprite.copy()
+            variant.fill(color, special_flags=pygame.BLEND_RGB_ADD)
+            variants[name].append(variant)
+    return variants
+
+
 def check_collision_direction(left_rect, right_rect):
     """Check direction of collision between two rectangles. right_rect must be a cube for this to work properly!"""
     # Calculate distances between centers.